@@ -0,0 +1,211 @@
+# bench_inference.py
+# 場所: benchmarks/bench_inference.py
+#
+# 推論まわりのマイクロベンチマーク（サーバーが実際に通る処理）
+#   decode_base64_bytes / 推論パイプラインの段階の組み合わせ（FacePipeline）/ 変化の検出で省略したとき /
+#   analyze_frame_bytes（スケジューラ → 推論 → スコア計算。このプロセス内で推論）/ 特徴点 → EAR
+# 合成フレームと録画フレーム（benchmarks/frames/*.jpg）を複数の解像度で計測し、
+# スループットと p50 / p99 を表示して results/<コミット>.json に保存する
+#
+# 使い方（sd_2506.application で実行）:
+#   python benchmarks/bench_inference.py
+#   python benchmarks/bench_inference.py --compare benchmarks/results/<比較元>.json
+#
+# frames/astronaut_512.jpg はNASAのパブリックドメイン画像（scikit-imageの astronaut）
+
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from focus_app import app  # noqa: E402
+from focus_app import main  # noqa: E402
+from focus_app import scoring  # noqa: E402
+from focus_app.pipeline import FacePipeline  # noqa: E402
+
+# analyze_frame_bytes はプロセスプールを使わず、このプロセス内で推論する
+app.config['INFERENCE_WORKERS'] = 0
+# 計測に使う生徒のキー
+BENCH_USER_ID = -1
+
+FRAMES_DIR = os.path.join(BENCH_DIR, 'frames')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720)]
+
+# 推論パイプラインの段階の組み合わせ（名前, FacePipeline の引数）
+PIPELINES = [
+    ('full+iris', {'refine_landmarks': True}),
+    ('full', {}),
+    ('reduced2', {'decode_scale': 2}),
+    ('reduced2+detector', {'decode_scale': 2, 'face_detector': True}),
+]
+
+
+# 合成フレーム（グラデーション + ノイズ。顔は写っていない）
+def synthetic_frame(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    frame = np.broadcast_to(gradient, (height, width, 3)).copy()
+    frame += rng.normal(0, 20, frame.shape).astype(np.float32)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+# 計測用のフレーム一覧 [(名前, BGR画像)]
+def load_frames(frames_dir):
+    frames = []
+    for width, height in RESOLUTIONS:
+        frames.append((f'synthetic {width}x{height}', synthetic_frame(width, height)))
+
+    if os.path.isdir(frames_dir):
+        for filename in sorted(os.listdir(frames_dir)):
+            if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                continue
+            image = cv2.imread(os.path.join(frames_dir, filename))
+            if image is None:
+                continue
+            name = os.path.splitext(filename)[0]
+            for width, height in RESOLUTIONS:
+                resized = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+                frames.append((f'{name} {width}x{height}', resized))
+    return frames
+
+
+def to_jpeg(frame, quality=80):
+    ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return jpeg.tobytes()
+
+
+def to_data_url(frame, quality=80):
+    return 'data:image/jpeg;base64,' + base64.b64encode(to_jpeg(frame, quality)).decode('ascii')
+
+
+# func を繰り返し実行して1回ごとの時間を集計
+def measure(func, min_time=1.0, min_iters=20, warmup=3):
+    for _ in range(warmup):
+        func()
+
+    durations = []
+    start = time.perf_counter()
+    while len(durations) < min_iters or time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - t0)
+
+    durations = np.array(durations)
+    return {
+        'iterations': int(durations.size),
+        'ops_per_sec': float(durations.size / durations.sum()),
+        'p50_ms': float(np.percentile(durations, 50) * 1000),
+        'p99_ms': float(np.percentile(durations, 99) * 1000),
+    }
+
+
+def run(frames, min_time):
+    results = {}
+    pipelines = [(tier, FacePipeline(**options)) for tier, options in PIPELINES]
+    # 変化の検出つき（同じフレームが続くと FaceMesh を省略する）
+    gated = FacePipeline(**dict(PIPELINES[-2][1], motion_threshold=1.0, motion_max_skips=1 << 30,
+                                motion_max_age=float('inf')))
+
+    for name, frame in frames:
+        data_url = to_data_url(frame)
+        results[f'decode_base64_bytes[{name}]'] = measure(
+            lambda: main.decode_base64_bytes(data_url), min_time)
+
+        # JPEG → EAR までを段階の組み合わせごとに計測
+        jpeg = main.decode_base64_bytes(data_url)
+        for tier, pipeline in pipelines:
+            results[f'pipeline[{tier}][{name}]'] = measure(
+                lambda: pipeline.analyze_jpeg(jpeg), min_time)
+        gated.analyze_frame(jpeg, BENCH_USER_ID)
+        results[f'pipeline[motion skipped][{name}]'] = measure(
+            lambda: gated.analyze_frame(jpeg, BENCH_USER_ID), min_time)
+
+        # サーバーの処理全体（左右反転したフレームと交互に送り、変化の検出で省略されないようにする）
+        jpegs = [jpeg, to_jpeg(cv2.flip(frame, 1))]
+        sent = [0]
+
+        def analyze_frame_bytes():
+            sent[0] += 1
+            main.analyze_frame_bytes(BENCH_USER_ID, jpegs[sent[0] % 2])
+        results[f'analyze_frame_bytes[{name}]'] = measure(analyze_frame_bytes, min_time)
+
+        # 顔が写っているフレームだけ特徴点 → EAR を計測
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        detected = main.get_face_pipeline().face_mesh.process(rgb).multi_face_landmarks
+        if not detected:
+            continue
+        landmarks = detected[0]
+        results[f'features[{name}]'] = measure(
+            lambda: scoring.compute_features(scoring.landmarks_to_points(landmarks)), min_time)
+
+    main.frame_scheduler.close()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=BENCH_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_results(results, baseline=None):
+    header = f"{'benchmark':55} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9}"
+    if baseline:
+        header += f" {'p50 比':>8}"
+    print(header)
+    print('-' * len(header))
+    for key, r in results.items():
+        line = f"{key:55} {r['ops_per_sec']:10.1f} {r['p50_ms']:9.3f} {r['p99_ms']:9.3f}"
+        if baseline and key in baseline:
+            line += f" {r['p50_ms'] / baseline[key]['p50_ms']:8.2f}x"
+        print(line)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='推論まわりのマイクロベンチマーク')
+    parser.add_argument('--frames-dir', default=FRAMES_DIR, help='録画フレーム（JPEG/PNG）のディレクトリ')
+    parser.add_argument('--min-time', type=float, default=1.0, help='1項目あたりの最小計測時間（秒）')
+    parser.add_argument('--output', help='結果JSONの保存先（既定: benchmarks/results/<コミット>.json）')
+    parser.add_argument('--compare', help='比較元の結果JSON')
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames_dir)
+    results = run(frames, args.min_time)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': commit,
+            'date': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f'\n結果を保存しました: {output}')
+
+
+if __name__ == '__main__':
+    main_cli()
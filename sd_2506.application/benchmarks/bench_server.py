@@ -0,0 +1,155 @@
+# bench_server.py
+# 場所: benchmarks/bench_server.py
+#
+# 同時アクセス時のサーバー比較
+#   wsgi: 従来の server.py と同じ Flask の app.run()
+#   asgi: server_asgi.py と同じ uvicorn + focus_app.asgi
+# 生徒役のクライアントが画像を送り続けている間に、ログインページと先生用ページを
+# 取得し続け、ページ表示のレイテンシ（p50 / p99）と画像解析のスループットを計測する
+#
+# 使い方（sd_2506.application で実行）:
+#   python benchmarks/bench_server.py
+#   python benchmarks/bench_server.py --servers asgi --students 30 --duration 20
+
+import argparse
+import http.cookiejar
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+FRAME_PATH = os.path.join(BENCH_DIR, 'frames', 'astronaut_512.jpg')
+
+SERVER_CODE = {
+    'wsgi': "from focus_app.main import app; app.run(port={port}, debug=False)",
+    'asgi': ("import uvicorn; from focus_app.asgi import asgi_app; "
+             "uvicorn.run(asgi_app, port={port}, log_level='warning')"),
+}
+
+
+def start_server(kind, port, workdir):
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    code = SERVER_CODE[kind].format(port=port)
+    return subprocess.Popen([sys.executable, '-c', code], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/', timeout=1).read()
+            return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError('サーバーが起動しませんでした')
+
+
+def new_client():
+    return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+
+# 新規登録（そのままログイン状態になる）
+def signup(base_url, username, user_type):
+    client = new_client()
+    data = urllib.parse.urlencode({'username': username, 'password': 'pass', 'user_type': user_type}).encode()
+    client.open(base_url + '/signup', data=data, timeout=30).read()
+    return client
+
+
+def student_loop(client, base_url, frame, stop, counter):
+    while not stop.is_set():
+        request = urllib.request.Request(base_url + '/api/frame', data=frame,
+                                         headers={'Content-Type': 'image/jpeg'})
+        try:
+            client.open(request, timeout=30).read()
+            counter.append(1)
+        except (urllib.error.URLError, OSError):
+            pass
+
+
+def page_loop(client, base_url, paths, stop, latencies):
+    i = 0
+    while not stop.is_set():
+        path = paths[i % len(paths)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            client.open(base_url + path, timeout=30).read()
+            latencies.append(time.perf_counter() - t0)
+        except (urllib.error.URLError, OSError):
+            latencies.append(float('inf'))
+
+
+def bench(kind, port, students, page_clients, duration):
+    base_url = f'http://127.0.0.1:{port}'
+    with open(FRAME_PATH, 'rb') as f:
+        frame = f.read()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(kind, port, workdir)
+        try:
+            wait_ready(base_url)
+            teacher = signup(base_url, 'bench_teacher', 'teacher')
+            student_clients = [signup(base_url, f'bench_student{i}', 'student') for i in range(students)]
+            # 推論ワーカーの起動を待つ
+            student_clients[0].open(urllib.request.Request(
+                base_url + '/api/frame', data=frame, headers={'Content-Type': 'image/jpeg'}), timeout=120).read()
+
+            stop = threading.Event()
+            frames_done = []
+            latencies = []
+            threads = [threading.Thread(target=student_loop, args=(c, base_url, frame, stop, frames_done))
+                       for c in student_clients]
+            threads += [threading.Thread(target=page_loop,
+                                         args=(teacher, base_url, ['/', '/signup', '/index_teacher'],
+                                               stop, latencies))
+                        for _ in range(page_clients)]
+            for t in threads:
+                t.start()
+            time.sleep(duration)
+            stop.set()
+            for t in threads:
+                t.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    lat = np.array(latencies)
+    ok = lat[np.isfinite(lat)]
+    return {
+        'frames_per_sec': len(frames_done) / duration,
+        'pages_per_sec': ok.size / duration,
+        'page_p50_ms': float(np.percentile(ok, 50) * 1000) if ok.size else float('nan'),
+        'page_p99_ms': float(np.percentile(ok, 99) * 1000) if ok.size else float('nan'),
+        'page_errors': int(lat.size - ok.size),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同時アクセス時のサーバー比較')
+    parser.add_argument('--servers', nargs='+', default=['wsgi', 'asgi'], choices=sorted(SERVER_CODE))
+    parser.add_argument('--students', type=int, default=10, help='画像を送り続ける生徒数')
+    parser.add_argument('--page-clients', type=int, default=4, help='ページを取得し続けるクライアント数')
+    parser.add_argument('--duration', type=float, default=10.0, help='計測時間（秒）')
+    parser.add_argument('--port', type=int, default=5051)
+    args = parser.parse_args()
+
+    print(f"{'server':8} {'frames/s':>9} {'pages/s':>9} {'page p50 ms':>12} {'page p99 ms':>12} {'errors':>7}")
+    for kind in args.servers:
+        r = bench(kind, args.port, args.students, args.page_clients, args.duration)
+        print(f"{kind:8} {r['frames_per_sec']:9.1f} {r['pages_per_sec']:9.1f} "
+              f"{r['page_p50_ms']:12.1f} {r['page_p99_ms']:12.1f} {r['page_errors']:7d}")
+
+
+if __name__ == '__main__':
+    main()
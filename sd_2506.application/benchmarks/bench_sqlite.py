@@ -0,0 +1,135 @@
+# bench_sqlite.py
+# 場所: benchmarks/bench_sqlite.py
+#
+# リクエストごとのSQLiteのオーバーヘッドの比較
+#   connect: 以前の書き方（問い合わせのたびに sqlite3.connect() して閉じる）
+#   pool:    focus_app/db.py の接続プール（接続・PRAGMA・ステートメントを使い回す）
+# main.py のヘルパーと同じSQLを同じデータに対して実行し、1回あたりの時間を比べる
+#
+# 使い方（sd_2506.application で実行）:
+#   python benchmarks/bench_sqlite.py
+#   python benchmarks/bench_sqlite.py --students 500 --threads 8
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bench_inference import measure, print_results
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from focus_app import db, main  # noqa: E402
+
+# (名前, SQL, パラメータ)
+QUERIES = [
+    ('login_process', "SELECT user_id, name, user_type FROM users WHERE name = ? AND password = ?",
+     ('student42', 'pass')),
+    ('is_registered', "SELECT 1 FROM users WHERE name = ?", ('student42',)),
+    ('get_all_students', "SELECT user_id, name FROM users WHERE user_type = 'student' ORDER BY name",
+     ()),
+    ('get_user_history', """
+        SELECT session_id, teacher_name, start_time, end_time,
+               focus_seconds, unfocus_seconds, tags, memo
+        FROM learning_sessions
+        WHERE user_id = ? AND is_active = 0
+        ORDER BY start_time DESC
+        LIMIT ?
+     """, (42, 10)),
+    ('update_user_session', """
+        UPDATE learning_sessions
+        SET focus_seconds = focus_seconds + 1, unfocus_seconds = ?
+        WHERE session_id = ?
+     """, (0, 1)),
+]
+
+
+def setup(path, students, sessions_per_student):
+    main.table_create(path)
+    with db.connection(path) as conn:
+        conn.executemany("INSERT INTO users (name, password, user_type) VALUES (?, 'pass', 'student')",
+                         [(f'student{i}',) for i in range(students)])
+        conn.executemany("""
+            INSERT INTO learning_sessions (user_id, teacher_name, start_time, end_time, is_active)
+            VALUES (?, 'teacher', ?, ?, 0)
+        """, [(user_id, f'2026-01-{day:02d}T10:00:00', f'2026-01-{day:02d}T11:00:00')
+              for user_id in range(1, students + 1) for day in range(1, sessions_per_student + 1)])
+
+
+# 以前の書き方
+def run_connect(path, sql, params):
+    with sqlite3.connect(path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def run_pool(path, sql, params):
+    with db.connection(path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+RUNNERS = {'connect': run_connect, 'pool': run_pool}
+
+
+# 複数スレッドから同時に実行したときの1回あたりの時間
+def measure_threads(func, threads, duration):
+    stop = threading.Event()
+
+    def worker():
+        durations = []
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - t0)
+        return durations
+
+    with ThreadPoolExecutor(threads) as executor:
+        futures = [executor.submit(worker) for _ in range(threads)]
+        time.sleep(duration)
+        stop.set()
+        durations = np.concatenate([f.result() for f in futures])
+    return {
+        'iterations': int(durations.size),
+        'ops_per_sec': float(durations.size / duration),
+        'p50_ms': float(np.percentile(durations, 50) * 1000),
+        'p99_ms': float(np.percentile(durations, 99) * 1000),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='SQLiteの接続方法ごとのオーバーヘッド比較')
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=20, help='生徒1人あたりの過去のセッション数')
+    parser.add_argument('--min-time', type=float, default=1.0, help='1項目あたりの最小計測時間（秒）')
+    parser.add_argument('--threads', type=int, default=1, help='同時に実行するスレッド数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.db')
+        setup(path, args.students, args.sessions)
+
+        results = {}
+        for name, sql, params in QUERIES:
+            for mode, runner in RUNNERS.items():
+                func = lambda: runner(path, sql, params)  # noqa: E731
+                if args.threads > 1:
+                    results[f'{name}[{mode}]'] = measure_threads(func, args.threads, args.min_time)
+                else:
+                    results[f'{name}[{mode}]'] = measure(func, args.min_time)
+        db.close_all()
+
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -7,4 +7,5 @@ app.config.from_object('focus_app.config')
 # session
 app.secret_key = secrets.token_hex(16)
 
-from . import main
\ No newline at end of file
+# ルート（main.py）はここでは読み込まない（推論デーモンは設定だけを使うため）
+# Webサーバーは focus_app.main の app（ルート登録済み）を使う
\ No newline at end of file
@@ -0,0 +1,89 @@
+# analytics.py
+# 場所: focus_app/analytics.py
+#
+# クラス全体の集計（先生用）
+# セッションの行をNumPyの構造化配列として受け取り、Pythonのループを使わずに
+# 平均集中率・アラート件数・分布・集中率の低い生徒を求める
+
+import numpy as np
+
+# 1セッション分（learning_sessions + session_stats）
+SESSION_DTYPE = np.dtype([
+    ('user_id', '<i8'),
+    ('focus_seconds', '<f8'),
+    ('unfocus_seconds', '<f8'),
+    ('frames', '<i8'),
+    ('face_frames', '<i8'),
+    ('score_sum', '<f8'),
+])
+
+# 分布の区切り（集中率・平均スコアとも 0〜100 を10刻み）
+BINS = np.linspace(0, 100, 11)
+
+
+def _rate(numerator, denominator):
+    # 分母が0のところは NaN
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / denominator * 100, np.nan)
+
+
+def _histogram(values):
+    values = values[~np.isnan(values)]
+    counts, _ = np.histogram(values, bins=BINS)
+    return [{'from': int(lo), 'to': int(hi), 'count': int(n)}
+            for lo, hi, n in zip(BINS[:-1], BINS[1:], counts)]
+
+
+def _mean(values):
+    values = values[~np.isnan(values)]
+    return round(float(values.mean()), 1) if values.size else None
+
+
+def class_summary(sessions, top_n=5, alert_rate=25, alert_min_seconds=60):
+    """
+    sessions: SESSION_DTYPE の配列
+    戻り値: 集計結果の dict（least_focused は user_id と集中率の一覧。名前は呼び出し側で付ける）
+    """
+    focus = sessions['focus_seconds']
+    unfocus = sessions['unfocus_seconds']
+    total = focus + unfocus
+
+    # セッションごとの集中率・アラート（先生用ダッシュボードと同じ判定）
+    focus_rate = _rate(focus, total)
+    alerted = (total >= alert_min_seconds) & (100 - focus_rate > alert_rate)
+    avg_score = _rate(sessions['score_sum'], sessions['frames'] * 100.0)
+
+    # 生徒ごとの合計（user_id ごとに bincount でまとめる）
+    user_ids, index = np.unique(sessions['user_id'], return_inverse=True)
+    student_focus = np.bincount(index, weights=focus, minlength=user_ids.size)
+    student_total = np.bincount(index, weights=total, minlength=user_ids.size)
+    student_alerts = np.bincount(index, weights=alerted, minlength=user_ids.size)
+    student_rate = _rate(student_focus, student_total)
+
+    # 集中率の低い順（計測時間の無い生徒は除く）
+    measured = np.flatnonzero(student_total > 0)
+    order = measured[np.argsort(student_rate[measured], kind='stable')][:top_n]
+
+    frames = sessions['frames'].sum()
+    return {
+        'sessions': int(sessions.size),
+        'students': int(user_ids.size),
+        'focus_seconds': int(focus.sum()),
+        'unfocus_seconds': int(unfocus.sum()),
+        # 全時間に対する集中時間の割合と、セッションごとの集中率の平均
+        'focus_rate': round(float(focus.sum() / total.sum() * 100), 1) if total.sum() > 0 else None,
+        'mean_session_focus_rate': _mean(focus_rate),
+        'avg_score': round(float(sessions['score_sum'].sum() / frames), 1) if frames else None,
+        'face_rate': round(float(sessions['face_frames'].sum() / frames * 100), 1) if frames else None,
+        'alert_sessions': int(alerted.sum()),
+        'alert_students': int(np.count_nonzero(student_alerts)),
+        'focus_rate_distribution': _histogram(focus_rate),
+        'avg_score_distribution': _histogram(avg_score),
+        'least_focused': [{
+            'user_id': int(user_ids[i]),
+            'focus_rate': round(float(student_rate[i]), 1),
+            'focus_seconds': int(student_focus[i]),
+            'unfocus_seconds': int(student_total[i] - student_focus[i]),
+            'alert_sessions': int(student_alerts[i]),
+        } for i in order],
+    }
@@ -0,0 +1,322 @@
+# asgi.py
+# 場所: focus_app/asgi.py
+#
+# 非同期サーバー（uvicorn など）用のASGIアプリ
+#   uvicorn focus_app.asgi:asgi_app
+#
+# - 画像解析（POST /api/frame）はイベントループ上で受け取り、推論はスケジューラ
+#   （scheduler.py。プロセスプールにまとめて渡す）に任せて await するので、解析中もループは止まらない
+# - 先生用ダッシュボードのプッシュ配信（GET /api/teacher/events）もループ上で待つので、
+#   開いているタブの数だけスレッドを占有しない
+# - WebSocket（/ws/frames）で生徒のフレームを受け取り、判定結果を送り返す
+# - それ以外のルート（ログイン・新規登録・先生用ダッシュボードなど）はFlaskアプリを
+#   スレッドプールで実行して返す
+
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request, session
+
+from . import app
+from . import db
+from . import main
+from . import metrics
+from .events import teacher_events, format_sse
+
+# Flask（WSGI）側を動かすスレッドプール
+_wsgi_executor = ThreadPoolExecutor(max_workers=app.config.get('ASGI_THREADS', 32),
+                                    thread_name_prefix='wsgi')
+
+_END = object()
+
+
+# ASGIのscope → WSGIのenviron
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            key = 'CONTENT_TYPE'
+        elif name == 'CONTENT_LENGTH':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def send_json(send, status, data, headers=()):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode('latin-1')),
+                    *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# クライアントの切断を待つ
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+# Flaskアプリをスレッドで実行してレスポンスを返す
+async def run_wsgi(environ, receive, send):
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                              for name, value in headers]
+        started['sized'] = any(name.lower() == 'content-length' for name, _ in headers)
+        return lambda data: None
+
+    def call_app():
+        iterable = app(environ, start_response)
+        iterator = iter(iterable)
+        first = next(iterator, _END)
+        # 長さが決まっているレスポンスはスレッド内でまとめて読み切る
+        if started.get('sized'):
+            chunks = [] if first is _END else [first]
+            chunks.extend(iterator)
+            return iterable, None, b''.join(chunks)
+        return iterable, iterator, first
+
+    iterable, iterator, first = await loop.run_in_executor(_wsgi_executor, call_app)
+    try:
+        await send({'type': 'http.response.start',
+                    'status': started['status'],
+                    'headers': started['headers']})
+        if iterator is None:
+            await send({'type': 'http.response.body', 'body': first})
+            return
+
+        # ストリーミングレスポンス（長さ不明）は1チャンクずつ送る
+        # クライアントが切断したら打ち切ってジェネレーターを閉じる
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        try:
+            chunk = first
+            while chunk is not _END and not disconnected.done():
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(_wsgi_executor, next, iterator, _END)
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+    finally:
+        if hasattr(iterable, 'close'):
+            await loop.run_in_executor(_wsgi_executor, iterable.close)
+
+
+# POST /api/frame をイベントループ上で処理
+async def handle_frame(environ, body, receive, send):
+    start = time.perf_counter()
+    route = '/api/frame'
+    try:
+        with app.request_context(environ):
+            if 'username' not in session or session.get('user_type') != 'student':
+                await send_json(send, 401, {"success": False, "error": "未ログインまたは権限がありません"})
+                return
+            user_id = session['user_id']
+            if environ.get('CONTENT_TYPE', '').startswith('multipart/form-data'):
+                # multipartのBlobはFlask側で取り出す
+                upload = request.files.get('image')
+                body = upload.read() if upload else b''
+
+        if not body:
+            await send_json(send, 400, {"success": False, "error": "画像データがありません"})
+            return
+
+        try:
+            score, interval = await analyze_frame(user_id, body, route)
+        except main.Overloaded as e:
+            await send_json(send, 429, {"success": False, "error": "サーバーが混み合っています。しばらくしてから再送してください",
+                                        "next_interval_ms": e.retry_after * 1000},
+                            [(b'retry-after', str(e.retry_after).encode('latin-1'))])
+            return
+        await send_json(send, 200, main.focus_result(score, interval))
+    finally:
+        metrics.observe('request', time.perf_counter() - start, route)
+
+
+# JPEGを解析して (スコア, 次のキャプチャまでの間隔) を返す（ループを止めずに待つ）
+# 混み合っているときは Overloaded
+async def analyze_frame(user_id, image_bytes, route):
+    # 推論（前のフレームから変わっていなければ省略）はスケジューラに任せ、結果だけを待つ
+    infer_start = time.perf_counter()
+    result = await asyncio.wrap_future(main.submit_frame(user_id, image_bytes, route))
+    metrics.observe('inference', time.perf_counter() - infer_start, route)
+    return result
+
+
+# ログイン中の生徒の user_id（生徒でなければ None）
+def student_id_from(environ):
+    with app.request_context(environ):
+        if 'username' not in session or session.get('user_type') != 'student':
+            return None
+        return session['user_id']
+
+
+# WebSocket /ws/frames
+# 生徒 → サーバー: JPEGのバイナリメッセージ
+# サーバー → 生徒: 判定結果のJSON（テキストメッセージ）
+async def handle_frame_socket(scope, receive, send):
+    route = '/ws/frames'
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    user_id = student_id_from(build_environ(dict(scope, method='GET'), b''))
+    await send({'type': 'websocket.accept'})
+    if user_id is None:
+        # 未ログイン（4401 はクライアント側でログインページへ戻す合図）
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        image_bytes = message.get('bytes')
+        if not image_bytes:
+            continue
+
+        start = time.perf_counter()
+        try:
+            score, interval = await analyze_frame(user_id, image_bytes, route)
+            result = main.focus_result(score, interval)
+        except main.Overloaded as e:
+            # 混み合っているときは次のフレームを Retry-After 秒後に送ってもらう
+            result = {"success": False, "error": "サーバーが混み合っています。しばらくしてから再送してください",
+                      "next_interval_ms": e.retry_after * 1000}
+        await send({'type': 'websocket.send', 'text': json.dumps(result, ensure_ascii=False)})
+        metrics.observe('message', time.perf_counter() - start, route)
+
+
+# GET /api/teacher/events（Server-Sent Events）をイベントループ上で配信
+async def handle_teacher_events(environ, body, receive, send):
+    with app.request_context(environ):
+        authorized = 'username' in session and session.get('user_type') == 'teacher'
+    if not authorized:
+        await send_json(send, 403, {"success": False, "error": "権限がありません"})
+        return
+
+    heartbeat = app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+    subscription = teacher_events.subscribe_async()
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                        (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        while not disconnected.done():
+            events = await subscription.wait_async(heartbeat)
+            if disconnected.done():
+                break
+            if events:
+                text = ''.join(format_sse(*event) for event in events)
+            else:
+                # 接続維持用のコメント行
+                text = ': ping\n\n'
+            await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+    finally:
+        disconnected.cancel()
+        teacher_events.unsubscribe(subscription)
+
+
+# イベントループ上で直接処理するルート
+ASYNC_ROUTES = {
+    ('POST', '/api/frame'): handle_frame,
+    ('GET', '/api/teacher/events'): handle_teacher_events,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if main.inference_pool is not None:
+                main.inference_pool.shutdown()
+            _wsgi_executor.shutdown(wait=False)
+            main.frame_scheduler.close()
+            main.session_counters.close()
+            main.frame_series.close()
+            main.frame_rollups.close()
+            db.close_all()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def asgi_app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] == 'websocket':
+        if scope['path'] == '/ws/frames':
+            await handle_frame_socket(scope, receive, send)
+        else:
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+        return
+    if scope['type'] != 'http':
+        return
+
+    body = await read_body(receive)
+    if body is None:
+        return
+    environ = build_environ(scope, body)
+
+    handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+    if handler is not None:
+        await handler(environ, body, receive, send)
+    else:
+        await run_wsgi(environ, receive, send)
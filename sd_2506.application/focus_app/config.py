@@ -1 +1,90 @@
-DEBUG = True
\ No newline at end of file
+import os
+
+DEBUG = True
+
+# FaceMesh推論のワーカープロセス数（0 でリクエストスレッド内で推論）
+INFERENCE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# 推論デーモン（python -m focus_app.inference_daemon）のUnixソケット
+# 設定すると推論はデーモンに任せ、Webサーバーは推論ワーカーを持たない（cv2 / mediapipe も読み込まない）
+INFERENCE_SOCKET = None
+
+# 生徒ごとの判定状態を破棄するまでの無操作時間（秒）
+FOCUS_STATE_IDLE_SECONDS = 600
+
+# 生徒のブラウザでFace Meshを実行し、特徴点だけを送るモードを既定にする
+CLIENT_LANDMARKS = False
+
+# ASGIモードでFlaskのルートを実行するスレッド数
+ASGI_THREADS = 32
+
+# 先生用ダッシュボードのプッシュ配信で接続維持のコメントを送る間隔（秒）
+SSE_HEARTBEAT_SECONDS = 15
+
+# ユーザー・学習セッションを保存するデータベース（WALモード）
+DATABASE = 'TEST.db'
+
+# 学習セッションの集中時間・非集中時間をまとめてデータベースに書き込む間隔（秒）
+SESSION_FLUSH_SECONDS = 5
+
+# 集中時間を数えるとき、判定の間隔がこれより空いたら（カメラ停止など）この秒数までしか数えない
+FOCUS_MAX_GAP_SECONDS = 10
+
+# フレームごとの判定結果（時刻・スコア・EAR・顔の有無）を保存するディレクトリと書き込み間隔（秒）
+TIMESERIES_DIR = 'timeseries'
+TIMESERIES_FLUSH_SECONDS = 1
+
+# 生徒のカメラ画像のキャプチャ間隔（ミリ秒）
+# 判定結果と一緒に次の間隔を返し、集中が続いている間は最大まで伸ばし、
+# 顔なし・スコア低下のときは最短にする
+# CAPTURE_BACKOFF_AFTER: 集中していてスコアが変わらない推論結果がこの回数続いてから間隔を伸ばし始める
+CAPTURE_INTERVAL_MIN_MS = 1000
+CAPTURE_INTERVAL_BASE_MS = 3000
+CAPTURE_INTERVAL_MAX_MS = 8000
+CAPTURE_BACKOFF_AFTER = 3
+
+# 前回推論したフレームからほとんど変わっていないフレームはFaceMeshを省略し、前回のEARを使う
+# （推論するプロセス（推論ワーカー・推論デーモン）の中で比較する）
+# MOTION_THRESHOLD: 縮小したグレースケール画像の画素の差の平均（0〜255）がこれ未満なら変化なしとみなす
+# MOTION_MAX_SKIPS: 続けて省略する最大回数（目の開閉のような小さな変化を見逃し続けないように）
+# MOTION_MAX_AGE_MS: 前回の推論からこれ以上たったフレームは変化がなくても推論する
+#   （CAPTURE_INTERVAL_MAX_MS より長くする。短いと間隔を伸ばしたときに1回も省略できない）
+MOTION_GATE = True
+MOTION_THRESHOLD = 1.0
+MOTION_MAX_SKIPS = 2
+MOTION_MAX_AGE_MS = 10000
+
+# FaceMeshの推論パイプラインの段階（1フレームあたりのCPUと精度の調整用）
+# DECODE_SCALE: JPEGを 1/N の大きさでデコード（1, 2, 4, 8）
+# FACE_DETECTOR: 軽い顔検出器で顔の周りだけを切り出してからFaceMeshにかける（顔が無ければFaceMeshを省略）
+#   FaceMeshも内部で縮小画像に対して顔検出を行うため、640x480程度のカメラでは速くならない。高解像度のカメラ向け
+# IRIS_REFINEMENT: FaceMeshの虹彩の精密化（None: 判定に使う特徴量が虹彩の点を必要とするときだけ）
+DECODE_SCALE = 2
+FACE_DETECTOR = False
+IRIS_REFINEMENT = None
+
+# 推論のスケジューラ
+# SCHEDULER_MAX_PENDING: 推論を待てる生徒の数（超えたら 429 と Retry-After を返す）
+# SCHEDULER_BATCH_SIZE: 1回にまとめて推論に渡すフレームの最大数
+SCHEDULER_MAX_PENDING = 64
+SCHEDULER_BATCH_SIZE = 8
+
+# 生徒ごとのFaceMesh（前のフレームから顔を追跡するので、顔検出からやり直すより軽く、見失いにくい）
+# FACEMESH_CACHE_MB: 1プロセスあたりのメモリの上限（MB。FaceMesh 1つで約20MB。0 で全員が1つを共有）
+#   超えたら最も長くフレームの来ていない生徒のものから閉じる。推論ワーカーは生徒ごとに固定される
+# FACEMESH_IDLE_SECONDS: この秒数フレームの来ない生徒のFaceMeshは閉じる
+FACEMESH_CACHE_MB = 320
+FACEMESH_IDLE_SECONDS = 120
+
+# 推論パイプライン（pipeline.py の FacePipeline）に渡す設定
+# Webサーバーの推論ワーカーと推論デーモンで共通（デーモンはFlaskアプリを読み込まずにここだけを使う）
+PIPELINE_OPTIONS = {
+    'decode_scale': DECODE_SCALE,
+    'face_detector': FACE_DETECTOR,
+    'refine_landmarks': IRIS_REFINEMENT,
+    'facemesh_cache_mb': FACEMESH_CACHE_MB,
+    'facemesh_idle_seconds': FACEMESH_IDLE_SECONDS,
+    'motion_threshold': MOTION_THRESHOLD if MOTION_GATE else None,
+    'motion_max_skips': MOTION_MAX_SKIPS,
+    'motion_max_age': MOTION_MAX_AGE_MS / 1000,
+}
@@ -0,0 +1,103 @@
+# db.py
+# 場所: focus_app/db.py
+#
+# SQLiteの接続プール
+# 以前は問い合わせのたびに sqlite3.connect() して閉じていたので、毎回
+# ファイルを開き直し、PRAGMAやSQLの解析（プリペアドステートメント）も作り直していた
+# ここでは接続を使い回し、PRAGMAは接続を作るときに1回だけ設定する
+# sqlite3 は接続ごとに同じSQL文のステートメントをキャッシュするので、
+# 接続を使い回せばステートメントも再利用される
+#
+#   with db.connection(DB_FILENAME) as conn:
+#       conn.execute(...)
+# ブロックを抜けるとコミット（例外時はロールバック）して接続をプールに戻す
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 1ファイルあたりプールに残しておく接続数（それ以上は使い終わったら閉じる）
+POOL_SIZE = 8
+# 書き込みロックを待つ時間（ミリ秒）
+BUSY_TIMEOUT_MS = 5000
+# 接続ごとにキャッシュするSQL文の数
+CACHED_STATEMENTS = 256
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    # WALモードではコミットごとのfsyncを省いても壊れない（電源断で直前のコミットが消えうるだけ）
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}',
+)
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _open(self):
+        # スレッドをまたいで使い回すので check_same_thread=False
+        # （同時に使うのは1スレッドだけ）
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               timeout=BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=CACHED_STATEMENTS)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = _pools[path] = ConnectionPool(path)
+    return pool
+
+
+# プールから接続を借りる（with を抜けるとコミットして返す）
+def connection(path):
+    return get_pool(path).connection()
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
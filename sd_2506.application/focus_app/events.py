@@ -0,0 +1,118 @@
+# events.py
+# 場所: focus_app/events.py
+#
+# 先生用ダッシュボードへのプッシュ通知（Server-Sent Events）用のイベント配信
+# 生徒の状態が変わったとき（集中/非集中の切り替わり、セッション開始/終了、
+# アラートの発生/解除）だけイベントを流すので、ポーリングのように
+# 開いているタブの数だけ全生徒を問い合わせることはない
+
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+
+
+class Subscription:
+    """
+    購読者1人分のイベント列
+    溜まりすぎた（読まれていない）場合は古いイベントを捨てて overflowed を立てる
+    → クライアントには 'resync' を送って一覧を取り直してもらう
+    """
+
+    def __init__(self, max_queue):
+        self._queue = deque()
+        self._max_queue = max_queue
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = None
+        self._async_ready = None
+        self.overflowed = False
+
+    def _push(self, event):
+        with self._lock:
+            if len(self._queue) >= self._max_queue:
+                self._queue.clear()
+                self.overflowed = True
+            self._queue.append(event)
+        self._ready.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._async_ready.set)
+
+    def _pop_all(self):
+        with self._lock:
+            events = list(self._queue)
+            self._queue.clear()
+            overflowed, self.overflowed = self.overflowed, False
+            self._ready.clear()
+            if self._async_ready is not None:
+                self._async_ready.clear()
+        if overflowed:
+            return [('resync', '{}', None)]
+        return events
+
+    # スレッドから待つ（timeout 秒で空のリスト）
+    def wait(self, timeout):
+        self._ready.wait(timeout)
+        return self._pop_all()
+
+    # イベントループから待つ
+    async def wait_async(self, timeout):
+        try:
+            await asyncio.wait_for(self._async_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._pop_all()
+
+
+class EventBus:
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self):
+        subscription = Subscription(self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    # イベントループから読む購読（ASGIモード用）
+    def subscribe_async(self):
+        subscription = Subscription(self.max_queue)
+        subscription._loop = asyncio.get_running_loop()
+        subscription._async_ready = asyncio.Event()
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type, data):
+        # JSONへの変換は1回だけして全購読者で共有する
+        event = (event_type, json.dumps(data, ensure_ascii=False), next(self._ids))
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._push(event)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+# SSEの1イベント分のテキスト
+def format_sse(event_type, payload, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {payload}')
+    return '\n'.join(lines) + '\n\n'
+
+
+# 先生用ダッシュボード向けのイベント
+teacher_events = EventBus()
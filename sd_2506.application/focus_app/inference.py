@@ -0,0 +1,151 @@
+# inference.py
+# 場所: focus_app/inference.py
+#
+# FaceMeshの推論を複数プロセスに分散するプール
+# 各ワーカーは自分専用の推論パイプライン（pipeline.py。生徒ごとのFaceMeshを含む）を1つ持ち、JPEGのバイト列を受け取って
+# 変化の検出 → デコード → 顔検出 → FaceMesh → EAR計算 までを行い、結果だけを返す
+
+import functools
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import CancelledError, Future, InvalidStateError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import metrics
+from .pipeline import FacePipeline
+
+# ワーカープロセス内の推論パイプライン（プロセスごとに1つ）
+_worker_pipeline = None
+
+
+def _init_worker(pipeline_options):
+    global _worker_pipeline
+    _worker_pipeline = FacePipeline(**pipeline_options)
+
+
+# ワーカー側の処理: 複数の (生徒, JPEG) をまとめて推論（前回から変わっていないフレームは省略）
+def _analyze_jpegs(items):
+    return _worker_pipeline.analyze_jpegs(items)
+
+
+class InferencePool:
+    """
+    FaceMesh推論用のプロセスプール
+    workers: ワーカープロセス数
+    pipeline_options: 各ワーカーの FacePipeline に渡す引数
+
+    生徒ごとのFaceMeshのトラッキングを活かすため、同じ生徒のフレームはいつも同じワーカーに送る
+    （ワーカーごとに1プロセスの executor を持ち、生徒のキーのハッシュで選ぶ）
+    ワーカーのプロセスが落ちたら（メモリ不足で強制終了されたときなど）その executor だけを作り直す
+    """
+
+    def __init__(self, workers=None, pipeline_options=None):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self._pipeline_options = pipeline_options or {}
+        # mediapipe / TFLite のスレッドを持ったまま fork しないよう spawn を使う
+        self._context = multiprocessing.get_context('spawn')
+        self._executors = [self._create_executor() for _ in range(self.workers)]
+        self._lock = threading.Lock()
+        # 生徒の指定が無いフレームは順番に振り分ける
+        self._next = itertools.count()
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._pipeline_options,),
+        )
+
+    # 落ちたワーカーの executor を新しいものに取り替えて返す（別のスレッドが取り替え済みならそれを返す）
+    def _replace_executor(self, index, broken):
+        with self._lock:
+            if self._executors[index] is broken:
+                print(f"推論ワーカー {index} が停止したため起動し直します")
+                metrics.inc('inference_worker_restarts')
+                self._executors[index] = self._create_executor()
+                broken.shutdown(wait=False, cancel_futures=True)
+            return self._executors[index]
+
+    # ワーカーに chunk を投入して (executor, Future) を返す（落ちていれば取り替えてから投入）
+    def _submit_chunk(self, index, chunk):
+        executor = self._executors[index]
+        try:
+            return executor, executor.submit(_analyze_jpegs, chunk)
+        except BrokenProcessPool:
+            executor = self._replace_executor(index, executor)
+            return executor, executor.submit(_analyze_jpegs, chunk)
+
+    def _worker_index(self, key):
+        if key is None:
+            return next(self._next) % self.workers
+        return hash(key) % self.workers
+
+    def submit_batch(self, items):
+        # [(生徒, JPEG)] をワーカーごとにまとめて投入し、[(EAR, 段階ごとの処理時間, 推論を省略したか)] を
+        # 元の順で返す Future を返す
+        # （1フレームずつ送るよりプロセス間のやり取りが少ない。完了は待たない）
+        # 推論できなかったフレームの結果は例外になる
+        groups = {}
+        for position, (key, image_bytes) in enumerate(items):
+            positions, chunk = groups.setdefault(self._worker_index(key), ([], []))
+            positions.append(position)
+            chunk.append((key, image_bytes))
+
+        batch = Future()
+        results = [None] * len(items)
+        remaining = [len(groups)]
+        lock = threading.Lock()
+
+        # ワーカーごとの結果を元の位置に戻し、全部そろったら batch を完了する
+        # 推論中にワーカーが落ちたときは、起動し直したワーカーでその chunk だけを1回やり直す
+        # やり直しても失敗したら、その chunk のフレームの結果を例外にする（他のワーカーの生徒には影響させない）
+        def chunk_done(index, positions, chunk, executor, retry, future):
+            if future.cancelled():
+                try:
+                    batch.set_exception(CancelledError())
+                except InvalidStateError:
+                    pass
+                return
+            error = future.exception()
+            if retry and isinstance(error, BrokenProcessPool):
+                self._replace_executor(index, executor)
+                try:
+                    executor, future = self._submit_chunk(index, chunk)
+                except Exception as e:
+                    error = e
+                else:
+                    future.add_done_callback(functools.partial(chunk_done, index, positions, chunk, executor, False))
+                    return
+            if error is not None:
+                for position in positions:
+                    results[position] = error
+            else:
+                for position, result in zip(positions, future.result()):
+                    results[position] = result
+            with lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done:
+                batch.set_result(results)
+
+        if not groups:
+            batch.set_result(results)
+        for index, (positions, chunk) in groups.items():
+            executor, future = self._submit_chunk(index, chunk)
+            future.add_done_callback(functools.partial(chunk_done, index, positions, chunk, executor, True))
+        return batch
+
+    def analyze_batch(self, items):
+        # submit_batch の結果を待って返す（推論できなかったフレームがあれば例外を送出）
+        results = self.submit_batch(items).result()
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=True, cancel_futures=True)
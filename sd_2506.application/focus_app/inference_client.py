@@ -0,0 +1,227 @@
+# inference_client.py
+# 場所: focus_app/inference_client.py
+#
+# 推論デーモン（inference_daemon.py）とのやり取り
+# Webサーバー側はこのモジュールだけを使うので、cv2 / mediapipe を読み込まない（標準ライブラリのみ）
+#
+# Unixソケットの上で、要求と応答を1往復ずつ送受信する（数値はリトルエンディアン）
+#   要求: ヘッダ  'FI'(2バイト) / バージョン uint8 / フレーム数 N uint16
+#         N回     生徒のキー int64（指定なしは NO_KEY） / JPEGの長さ uint32 / JPEG
+#   応答: ヘッダ  'FI'(2バイト) / 状態 uint8（0: 成功） / フレーム数 N uint16
+#         N回     EAR float32（顔なしは NaN） / フラグ uint8 / 段階の数 M uint8 / M回 (段階の番号 uint8, 秒 float32)
+#                 フラグ: 1 = 変化が無いので推論を省略した / 2 = 推論できなかった（続けてエラーメッセージ）
+#         状態が0以外のときは、ヘッダの後にエラーメッセージ（長さ uint16 + UTF-8）
+
+import math
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAGIC = b'FI'
+VERSION = 2
+STATUS_OK = 0
+STATUS_ERROR = 1
+FLAG_SKIPPED = 1
+FLAG_ERROR = 2
+
+HEADER = struct.Struct('<2sBH')
+ITEM = struct.Struct('<qI')
+RESULT = struct.Struct('<fBB')
+STAGE = struct.Struct('<Bf')
+MESSAGE_LENGTH = struct.Struct('<H')
+
+# 生徒のキーの指定なし
+NO_KEY = -2 ** 63
+# 1フレームのJPEGの最大サイズ
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+# 段階の番号 → 名前（metrics の段階名と同じ）
+STAGES = ('imdecode', 'cvtColor', 'face_detection', 'facemesh', 'features', 'motion')
+STAGE_IDS = {name: i for i, name in enumerate(STAGES)}
+
+
+class ProtocolError(Exception):
+    """メッセージの形式が不正"""
+
+
+class InferenceError(Exception):
+    """推論デーモン側でエラーが発生した"""
+
+
+# ソケットから n バイトちょうど読む（途中で切断されたら ConnectionError）
+def recv_exact(sock, n):
+    buffer = bytearray(n)
+    view = memoryview(buffer)
+    received = 0
+    while received < n:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("推論デーモンとの接続が切れました")
+        received += count
+    return buffer
+
+
+def encode_request(items):
+    parts = [HEADER.pack(MAGIC, VERSION, len(items))]
+    for key, image_bytes in items:
+        parts.append(ITEM.pack(NO_KEY if key is None else key, len(image_bytes)))
+        parts.append(image_bytes)
+    return b''.join(parts)
+
+
+# 要求を読む → [(キー, JPEG)]（接続が閉じられていれば None）
+def read_request(sock):
+    try:
+        header = recv_exact(sock, HEADER.size)
+    except ConnectionError:
+        return None
+    magic, version, count = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError(f"対応していない要求です（magic={bytes(magic)!r}, version={version}）")
+    items = []
+    for _ in range(count):
+        key, length = ITEM.unpack(recv_exact(sock, ITEM.size))
+        if length > MAX_FRAME_BYTES:
+            raise ProtocolError(f"フレームが大きすぎます（{length}バイト）")
+        items.append((None if key == NO_KEY else key, bytes(recv_exact(sock, length))))
+    return items
+
+
+def encode_message(message):
+    data = message.encode('utf-8')[:0xFFFF]
+    return MESSAGE_LENGTH.pack(len(data)) + data
+
+
+def read_message(sock):
+    (length,) = MESSAGE_LENGTH.unpack(recv_exact(sock, MESSAGE_LENGTH.size))
+    return bytes(recv_exact(sock, length)).decode('utf-8', 'replace')
+
+
+# [(EAR, [(段階, 秒)], 推論を省略したか)]（推論できなかったフレームは例外）→ 応答
+def encode_response(results):
+    parts = [HEADER.pack(MAGIC, STATUS_OK, len(results))]
+    for result in results:
+        if isinstance(result, Exception):
+            parts.append(RESULT.pack(math.nan, FLAG_ERROR, 0))
+            parts.append(encode_message(f"推論中にエラーが発生しました: {result}"))
+            continue
+        ear, stage_times, skipped = result
+        stages = [(STAGE_IDS[stage], seconds) for stage, seconds in stage_times if stage in STAGE_IDS]
+        parts.append(RESULT.pack(math.nan if ear is None else ear, FLAG_SKIPPED if skipped else 0, len(stages)))
+        parts.extend(STAGE.pack(*stage) for stage in stages)
+    return b''.join(parts)
+
+
+def encode_error(message):
+    return HEADER.pack(MAGIC, STATUS_ERROR, 0) + encode_message(message)
+
+
+# 応答を読む → [(EAR（顔なしは None）, [(段階, 秒)], 推論を省略したか)]（推論できなかったフレームは InferenceError）
+def read_response(sock):
+    magic, status, count = HEADER.unpack(recv_exact(sock, HEADER.size))
+    if magic != MAGIC:
+        raise ProtocolError("推論デーモンからの応答の形式が不正です")
+    if status != STATUS_OK:
+        raise InferenceError(read_message(sock))
+    results = []
+    for _ in range(count):
+        ear, flags, stage_count = RESULT.unpack(recv_exact(sock, RESULT.size))
+        if flags & FLAG_ERROR:
+            results.append(InferenceError(read_message(sock)))
+            continue
+        stage_times = []
+        for _ in range(stage_count):
+            stage_id, seconds = STAGE.unpack(recv_exact(sock, STAGE.size))
+            stage_times.append((STAGES[stage_id], seconds))
+        results.append((None if math.isnan(ear) else ear, stage_times, bool(flags & FLAG_SKIPPED)))
+    return results
+
+
+class InferenceClient:
+    """
+    推論デーモンのクライアント（InferencePool と同じ submit_batch / analyze_batch / shutdown を持つ）
+    path: デーモンのUnixソケット
+    connections: 同時に使う接続の数（デーモンは接続ごとに並行して推論する）
+    使い終わった接続は使い回し、切れていたら次の要求で1回だけつなぎ直して送り直す
+    """
+
+    def __init__(self, path, timeout=30.0, connections=1):
+        self.path = path
+        self.timeout = timeout
+        # 使っていない接続
+        self._idle = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, connections),
+                                            thread_name_prefix='inference-client')
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    # 使っていない接続を取り出す（無ければつなぐ）
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _release(self, sock):
+        with self._lock:
+            self._idle.append(sock)
+
+    def _close_idle(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sock in idle:
+            sock.close()
+
+    # [(生徒, JPEG)] を推論して [(EAR, 段階ごとの処理時間, 推論を省略したか)] を返す
+    # （推論できなかったフレームの結果は InferenceError）
+    def _request(self, items):
+        request = encode_request(items)
+        for attempt in range(2):
+            sock = None
+            try:
+                sock = self._acquire()
+                sock.sendall(request)
+                results = read_response(sock)
+            except OSError:
+                if sock is not None:
+                    sock.close()
+                if attempt:
+                    raise
+                # デーモンが再起動したときは残りの接続も切れているので、つなぎ直す
+                self._close_idle()
+                continue
+            except ProtocolError:
+                sock.close()
+                raise
+            except InferenceError:
+                # エラーの応答は読み終えているので、接続はそのまま使える
+                self._release(sock)
+                raise
+            self._release(sock)
+            return results
+
+    def submit_batch(self, items):
+        # 別スレッドで推論を依頼して、結果の列を返す Future を返す（待たない）
+        return self._executor.submit(self._request, items)
+
+    def analyze_batch(self, items):
+        # 推論の結果を返す（推論できなかったフレームがあれば例外を送出）
+        results = self._request(items)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._close_idle()
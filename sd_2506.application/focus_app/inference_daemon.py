@@ -0,0 +1,113 @@
+# inference_daemon.py
+# 場所: focus_app/inference_daemon.py
+#
+# 推論デーモン
+# FaceMeshの推論プール（inference.py）を1つのプロセスにまとめ、Webサーバーの各ワーカーから
+# Unixソケット経由で使えるようにする。Webサーバー側は cv2 / mediapipe を読み込まないので
+# 起動が速く、メモリも少なくて済む（メッセージの形式は inference_client.py を参照）
+# フレームの変化による推論の省略（MOTION_GATE）もデーモンの推論ワーカーの中で行う
+# デーモンはFlaskアプリ（main.py）を読み込まず、config.py の設定だけを使う
+#
+# 使い方（sd_2506.application で実行）:
+#   python -m focus_app.inference_daemon
+#   python -m focus_app.inference_daemon --socket /tmp/focus_inference.sock --workers 4
+# Webサーバー側は config.py の INFERENCE_SOCKET に同じパスを設定する
+
+import argparse
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+from . import config
+from .inference import InferencePool
+from .inference_client import ProtocolError, encode_error, encode_response, read_request
+
+
+class InferenceHandler(socketserver.BaseRequestHandler):
+    # 1つの接続で要求 → 応答を繰り返す（Webサーバーのワーカーごとに1本）
+    def handle(self):
+        while True:
+            try:
+                items = read_request(self.request)
+            except ProtocolError as e:
+                self.request.sendall(encode_error(str(e)))
+                return
+            except OSError:
+                return
+            if items is None:
+                return
+
+            try:
+                # 推論できなかったフレームはそのフレームだけをエラーとして返す
+                response = encode_response(self.server.pool.submit_batch(items).result())
+            except Exception as e:
+                print("推論中にエラーが発生しました:", e)
+                response = encode_error(f"推論中にエラーが発生しました: {e}")
+            try:
+                self.request.sendall(response)
+            except OSError:
+                return
+
+
+class InferenceServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, pool):
+        self.pool = pool
+        super().__init__(path, InferenceHandler)
+
+
+# そのパスで別のデーモンが待ち受けているか（接続できれば待ち受けている）
+def socket_in_use(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='FaceMesh推論デーモン（Unixソケット）')
+    parser.add_argument('--socket', default=config.INFERENCE_SOCKET or '/tmp/focus_inference.sock',
+                        help='待ち受けるUnixソケットのパス（既定: config.py の INFERENCE_SOCKET）')
+    parser.add_argument('--workers', type=int, default=config.INFERENCE_WORKERS or 1,
+                        help='推論ワーカーのプロセス数（既定: config.py の INFERENCE_WORKERS）')
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        if socket_in_use(args.socket):
+            sys.exit(f"別の推論デーモンが {args.socket} で動いています")
+        # 前回のソケットファイルが残っていれば消す
+        os.unlink(args.socket)
+
+    pool = InferencePool(args.workers, config.PIPELINE_OPTIONS)
+    # 同じユーザー（とグループ）のWebサーバーだけが接続できるように、ソケットを作る前に umask を設定する
+    umask = os.umask(0o117)
+    try:
+        server = InferenceServer(args.socket, pool)
+    except OSError:
+        pool.shutdown()
+        raise
+    finally:
+        os.umask(umask)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"推論デーモンを起動しました: {args.socket}（ワーカー {pool.workers}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        print("推論デーモンを停止しました")
+
+
+if __name__ == '__main__':
+    main_cli()
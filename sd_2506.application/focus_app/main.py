@@ -1,21 +1,53 @@
 from . import app
-from flask import render_template, request, jsonify, redirect, session
-from datetime import datetime, date
-import cv2
-import mediapipe as mp
+from flask import render_template, request, jsonify, redirect, session, g, Response
+from datetime import datetime, date, timedelta
 import numpy as np
 import time
 import base64
 import sqlite3
 import secrets
+import atexit
+import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-
-mp_face_mesh = mp.solutions.face_mesh.FaceMesh(refine_landmarks=True)
-drawing = mp.solutions.drawing_utils
-score_data = {"score": 100}
-eye_closed_start_time = None
-gaze_away_start_time = None
-face_missing_start_time = None
+from .state import StateStore
+from . import scoring
+from . import analytics
+from . import metrics
+from . import db
+from .events import teacher_events, format_sse
+from .sessions import SessionRegistry
+from .writebehind import WriteBehindBuffer
+from .timeseries import TimeSeriesStore
+from .rollup import Rollups
+from .scheduler import FrameScheduler, Overloaded
+
+# 推論パイプラインの段階（変化の検出・縮小デコード・顔検出・虹彩の精密化。config.py を参照）
+PIPELINE_OPTIONS = app.config.get('PIPELINE_OPTIONS', {})
+
+# このプロセス内で推論するときのパイプライン
+# cv2 / mediapipe の読み込みとFaceMeshの作成は最初に使うときまで遅らせる
+# （ログインや先生用ページだけを返すプロセスは読み込まずに済み、起動も速い）
+face_pipeline = None
+
+
+def get_face_pipeline():
+    global face_pipeline
+    if face_pipeline is None:
+        from .pipeline import FacePipeline
+        face_pipeline = FacePipeline(**PIPELINE_OPTIONS)
+    return face_pipeline
+
+# 生徒ごとの判定状態（目の閉じ時間・顔なし時間・スコア）
+focus_states = StateStore(idle_timeout=app.config.get('FOCUS_STATE_IDLE_SECONDS', 600))
+
+# 生徒の名簿とセッション中の生徒（先生用ダッシュボードはここから返す）
+live_sessions = SessionRegistry(max_gap=app.config.get('FOCUS_MAX_GAP_SECONDS', 10))
+
+# セッションごとのフレーム単位の記録（時刻・スコア・EAR・顔の有無）
+frame_series = TimeSeriesStore(app.config.get('TIMESERIES_DIR', 'timeseries'),
+                               app.config.get('TIMESERIES_FLUSH_SECONDS', 1))
+atexit.register(frame_series.close)
 
 app.secret_key = secrets.token_hex(16)
 
@@ -27,9 +59,15 @@ app.secret_key = secrets.token_hex(16)
 redirect_target = {"url": "http://localhost:5000/index_coolver"}
 
 
+# ユーザー・学習セッションを保存するデータベース
+DB_FILENAME = app.config.get('DATABASE', 'TEST.db')
+
+
 # テーブルの作成
+@metrics.timed('sqlite.table_create')
 def table_create(db_filename):
-    with sqlite3.connect(db_filename) as conn:
+    # WALモードなどの設定は接続プール（db.py）で行う
+    with db.connection(db_filename) as conn:
         cursor = conn.cursor()
 
         # ユーザー登録テーブル作成クエリ
@@ -42,14 +80,11 @@ def table_create(db_filename):
             )
         """)
 
-#生徒個別のDB作成
-def create_user_db(username):
-    db_name = f"{username}.db"
-    with sqlite3.connect(db_name) as conn:
-        cursor = conn.cursor()
+        # 全生徒の学習セッション（以前は生徒ごとの {username}.db）
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS learning_sessions (
                 session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL REFERENCES users(user_id),
                 teacher_name TEXT,
                 start_time TEXT NOT NULL,
                 end_time TEXT,
@@ -60,12 +95,57 @@ def create_user_db(username):
                 is_active INTEGER DEFAULT 1
             )
         """)
-        conn.commit()
+        # 生徒ごとの進行中セッション・履歴の検索用
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_learning_sessions_user
+            ON learning_sessions (user_id, is_active, start_time)
+        """)
+        # 進行中のセッション一覧（先生用ダッシュボード）用
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_learning_sessions_active
+            ON learning_sessions (is_active) WHERE is_active = 1
+        """)
+        # 全生徒の履歴を新しい順にページ送りする用
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_learning_sessions_history
+            ON learning_sessions (is_active, start_time)
+        """)
+        # 先生ごとのクラス全体の集計用（集計に使う列も含めて、表を読まずに済ませる）
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_learning_sessions_teacher
+            ON learning_sessions (teacher_name, is_active, start_time, user_id, focus_seconds, unfocus_seconds)
+        """)
+
+        # フレームの判定結果の1分ごとの集計（minute はUNIX時刻の分）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS session_minutes (
+                session_id INTEGER NOT NULL,
+                minute INTEGER NOT NULL,
+                frames INTEGER NOT NULL,
+                face_frames INTEGER NOT NULL,
+                score_sum REAL NOT NULL,
+                score_min REAL,
+                score_max REAL,
+                PRIMARY KEY (session_id, minute)
+            ) WITHOUT ROWID
+        """)
+        # セッションごとの集計
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS session_stats (
+                session_id INTEGER PRIMARY KEY,
+                frames INTEGER NOT NULL,
+                face_frames INTEGER NOT NULL,
+                score_sum REAL NOT NULL,
+                score_min REAL,
+                score_max REAL
+            )
+        """)
 
 
 # データベースに挿入(ログイン)
+@metrics.timed('sqlite.database_insert')
 def database_insert(db_filename, name, password, user_type='student'):
-    with sqlite3.connect(db_filename) as conn:
+    with db.connection(db_filename) as conn:
         cursor = conn.cursor()
 
         # データの挿入（? プレースホルダでSQLインジェクション対策）
@@ -78,9 +158,10 @@ def database_insert(db_filename, name, password, user_type='student'):
 
 
 # データがあるかの処理
+@metrics.timed('sqlite.login_process')
 def login_process(db_filename, name, password):
     try:
-        with sqlite3.connect(db_filename) as conn:
+        with db.connection(db_filename) as conn:
             cursor = conn.cursor()
 
             # nameとpasswordが一致するレコードを検索
@@ -100,22 +181,23 @@ def login_process(db_filename, name, password):
 
 
 # 名前が含まれているか判定する
+@metrics.timed('sqlite.is_registered')
 def is_registered(db_filename, name):
-    conn = sqlite3.connect(db_filename)
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM users WHERE name = ?", (name,))
-    result = cursor.fetchone()
-    conn.close()
+    with db.connection(db_filename) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM users WHERE name = ?", (name,))
+        result = cursor.fetchone()
     return result is not None
 
 
 # 主キーと名前を取得(teacher)
+@metrics.timed('sqlite.get_teacher_users')
 def get_teacher_users(db_filename):
     """
     user_type='teacher' のユーザー (先生) を取得
     戻り値: list of tuples (user_id, name)
     """
-    with sqlite3.connect(db_filename) as conn:
+    with db.connection(db_filename) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT user_id, name
@@ -127,8 +209,9 @@ def get_teacher_users(db_filename):
     return teachers
 
 #全生徒の情報を取得
+@metrics.timed('sqlite.get_all_students')
 def get_all_students(db_filename):
-    with sqlite3.connect(db_filename) as conn:
+    with db.connection(db_filename) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT user_id, name
@@ -137,61 +220,73 @@ def get_all_students(db_filename):
             ORDER BY name
         """)
         return cursor.fetchall()
-    
-#アクティブなセッションを取得
-def get_user_active_session(username):
-    db_name = f"{username}.db"
-    try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT session_id, teacher_name, start_time, focus_seconds, unfocus_seconds
-                FROM learning_sessions
-                WHERE is_active = 1
-                ORDER BY start_time DESC
-                LIMIT 1
-            """)
-            row = cursor.fetchone()
-            if row:
-                return {
-                    'session_id': row[0],
-                    'teacher_name': row[1],
-                    'start_time': row[2],
-                    'focus_seconds': row[3],
-                    'unfocus_seconds': row[4]
-                }
-            return None
-    except sqlite3.OperationalError:
-        return None
 
-def start_user_session(username, teacher_name=None):
-    #学習セッション開始
-    db_name = f"{username}.db"
-    with sqlite3.connect(db_name) as conn:
+
+# learning_sessions の1行 → dict
+def session_row_to_dict(row):
+    return {
+        'session_id': row[0],
+        'user_id': row[1],
+        'teacher_name': row[2],
+        'start_time': row[3],
+        'focus_seconds': row[4],
+        'unfocus_seconds': row[5]
+    }
+
+#全生徒のアクティブなセッションを取得
+@metrics.timed('sqlite.get_active_sessions')
+def get_active_sessions():
+    with db.connection(DB_FILENAME) as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO learning_sessions (teacher_name, start_time, is_active)
-            VALUES (?, ?, 1)
-        """, (teacher_name or "先生なし", datetime.now().isoformat()))
-        conn.commit()
-        return cursor.lastrowid
+            SELECT session_id, user_id, teacher_name, start_time, focus_seconds, unfocus_seconds
+            FROM learning_sessions
+            WHERE is_active = 1
+            ORDER BY start_time
+        """)
+        return [session_row_to_dict(row) for row in cursor.fetchall()]
 
-def update_user_session(username, session_id, focus_seconds, unfocus_seconds):
-    #セッション更新（リアルタイム）
-    db_name = f"{username}.db"
-    with sqlite3.connect(db_name) as conn:
+@metrics.timed('sqlite.start_user_session')
+def start_user_session(user_id, teacher_name=None):
+    #学習セッション開始
+    with db.connection(DB_FILENAME) as conn:
         cursor = conn.cursor()
         cursor.execute("""
+            INSERT INTO learning_sessions (user_id, teacher_name, start_time, is_active)
+            VALUES (?, ?, ?, 1)
+        """, (user_id, teacher_name or "先生なし", datetime.now().isoformat()))
+        conn.commit()
+        session_id = cursor.lastrowid
+    frame_series.start(session_id)
+    return session_id
+
+# 集中時間・非集中時間をまとめて書き込む（items: [(session_id, (集中秒, 非集中秒))]）
+@metrics.timed('sqlite.write_session_counters')
+def write_session_counters(items):
+    with db.connection(DB_FILENAME) as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
             UPDATE learning_sessions
             SET focus_seconds = ?, unfocus_seconds = ?
             WHERE session_id = ?
-        """, (focus_seconds, unfocus_seconds, session_id))
-        conn.commit()
+        """, [(focus_seconds, unfocus_seconds, session_id)
+              for session_id, (focus_seconds, unfocus_seconds) in items])
 
-def end_user_session(username, session_id, tags='', memo=''):
+# 集中時間の書き込みバッファ（一定間隔・セッション終了時にまとめて書き込む）
+session_counters = WriteBehindBuffer(write_session_counters, app.config.get('SESSION_FLUSH_SECONDS', 5))
+atexit.register(session_counters.close)
+
+def update_user_session(session_id, focus_seconds, unfocus_seconds):
+    #セッション更新（リアルタイム）
+    #すぐには書き込まず、バッファで最新の値にまとめる
+    session_counters.put(session_id, (focus_seconds, unfocus_seconds))
+
+@metrics.timed('sqlite.end_user_session')
+def end_user_session(session_id, tags='', memo=''):
     # セッション終了
-    db_name = f"{username}.db"
-    with sqlite3.connect(db_name) as conn:
+    # 溜まっている集中時間を先に書き込む
+    session_counters.flush()
+    with db.connection(DB_FILENAME) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             UPDATE learning_sessions
@@ -200,32 +295,138 @@ def end_user_session(username, session_id, tags='', memo=''):
         """, (datetime.now().isoformat(), tags, memo, session_id))
         conn.commit()
     
-#個々の過去の学習履歴を取得
-def get_user_history(username, limit=10):
-    db_name = f"{username}.db"
-    try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT session_id, teacher_name, start_time, end_time, 
-                       focus_seconds, unfocus_seconds, tags, memo
-                FROM learning_sessions
-                WHERE is_active = 0
-                ORDER BY start_time DESC
-                LIMIT ?
-            """, (limit,))
-            return [{
-                'session_id': row[0],
-                'teacher_name': row[1],
-                'start_time': row[2],
-                'end_time': row[3],
-                'focus_seconds': row[4],
-                'unfocus_seconds': row[5],
-                'tags': row[6],
-                'memo': row[7]
-            } for row in cursor.fetchall()]
-    except sqlite3.OperationalError:
-        return []
+#過去の学習履歴を新しい順に取得（フレームの集計があれば平均スコア・顔が写っていた割合も）
+#user_id を省略すると全生徒分
+#ページ送りは前のページの最後の (start_time, session_id) より古いものを索引で探すので、
+#何ページ目でも読む行数は limit 件だけ
+@metrics.timed('sqlite.query_history')
+def query_history(user_id=None, teacher_name=None, start=None, end=None, after=None, limit=10):
+    conditions = ["s.is_active = 0"]
+    params = []
+    if user_id is not None:
+        conditions.append("s.user_id = ?")
+        params.append(user_id)
+    if teacher_name:
+        conditions.append("s.teacher_name = ?")
+        params.append(teacher_name)
+    if start:
+        conditions.append("s.start_time >= ?")
+        params.append(start)
+    if end:
+        conditions.append("s.start_time < ?")
+        params.append(end)
+    if after:
+        # start_time <= ? で索引の範囲を絞り、同じ時刻の行は session_id で続きから
+        conditions.append("s.start_time <= ? AND (s.start_time < ? OR s.session_id < ?)")
+        params.extend([after[0], after[0], after[1]])
+    params.append(limit)
+
+    with db.connection(DB_FILENAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT s.session_id, s.teacher_name, s.start_time, s.end_time, 
+                   s.focus_seconds, s.unfocus_seconds, s.tags, s.memo,
+                   st.frames, st.face_frames, st.score_sum, s.user_id
+            FROM learning_sessions s
+            LEFT JOIN session_stats st ON st.session_id = s.session_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY s.start_time DESC, s.session_id DESC
+            LIMIT ?
+        """, params)
+        return [{
+            'session_id': row[0],
+            'user_id': row[11],
+            'teacher_name': row[1],
+            'start_time': row[2],
+            'end_time': row[3],
+            'focus_seconds': row[4],
+            'unfocus_seconds': row[5],
+            'tags': row[6],
+            'memo': row[7],
+            'avg_score': round(row[10] / row[8], 1) if row[8] else None,
+            'face_rate': round(row[9] / row[8] * 100, 1) if row[8] else None
+        } for row in cursor.fetchall()]
+
+#クラス全体の集計用に、終了したセッションを構造化配列で取得
+@metrics.timed('sqlite.load_class_sessions')
+def load_class_sessions(teacher_name=None, start=None, end=None):
+    conditions = ["s.is_active = 0"]
+    params = []
+    if teacher_name:
+        conditions.append("s.teacher_name = ?")
+        params.append(teacher_name)
+    if start:
+        conditions.append("s.start_time >= ?")
+        params.append(start)
+    if end:
+        conditions.append("s.start_time < ?")
+        params.append(end)
+
+    with db.connection(DB_FILENAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT s.user_id, COALESCE(s.focus_seconds, 0), COALESCE(s.unfocus_seconds, 0),
+                   COALESCE(st.frames, 0), COALESCE(st.face_frames, 0), COALESCE(st.score_sum, 0)
+            FROM learning_sessions s
+            LEFT JOIN session_stats st ON st.session_id = s.session_id
+            WHERE {' AND '.join(conditions)}
+        """, params)
+        return np.fromiter(cursor, dtype=analytics.SESSION_DTYPE)
+
+# フレームの1分ごとの集計を書き込む（items: [((session_id, 分), 集計の行)]）
+@metrics.timed('sqlite.write_session_minutes')
+def write_session_minutes(items):
+    with db.connection(DB_FILENAME) as conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO session_minutes
+                (session_id, minute, frames, face_frames, score_sum, score_min, score_max)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(session_id, minute, *row) for (session_id, minute), row in items])
+
+# フレームのセッションごとの集計を書き込む（items: [(session_id, 集計の行)]）
+@metrics.timed('sqlite.write_session_stats')
+def write_session_stats(items):
+    with db.connection(DB_FILENAME) as conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO session_stats
+                (session_id, frames, face_frames, score_sum, score_min, score_max)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(session_id, *row) for session_id, row in items])
+
+@metrics.timed('sqlite.get_session_stats')
+def get_session_stats(session_id):
+    with db.connection(DB_FILENAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT frames, face_frames, score_sum, score_min, score_max
+            FROM session_stats WHERE session_id = ?
+        """, (session_id,))
+        return cursor.fetchone()
+
+# セッションの1分ごとの集計（グラフ用）
+@metrics.timed('sqlite.get_session_minutes')
+def get_session_minutes(session_id):
+    with db.connection(DB_FILENAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT minute, frames, face_frames, score_sum, score_min, score_max
+            FROM session_minutes
+            WHERE session_id = ?
+            ORDER BY minute
+        """, (session_id,))
+        return [{
+            'time': datetime.fromtimestamp(row[0] * 60).isoformat(),
+            'frames': row[1],
+            'avg_score': round(row[3] / row[1], 1),
+            'min_score': row[4],
+            'max_score': row[5],
+            'face_rate': round(row[2] / row[1] * 100, 1)
+        } for row in cursor.fetchall()]
+
+# フレームの判定結果の集計（1分ごと・セッションごと）
+frame_rollups = Rollups(write_session_minutes, write_session_stats, get_session_stats,
+                        app.config.get('SESSION_FLUSH_SECONDS', 5))
+atexit.register(frame_rollups.close)
 
 
 
@@ -235,86 +436,250 @@ def calculate_EAR(eye_landmarks):
     A = np.linalg.norm(eye_landmarks[1] - eye_landmarks[5])
     B = np.linalg.norm(eye_landmarks[2] - eye_landmarks[4])
     C = np.linalg.norm(eye_landmarks[0] - eye_landmarks[3])
-    print('debug1')
     return (A + B) / (2.0 * C)
 
 
-# 　目が閉じているかどうかを判断
-def calculate_focus_score(landmarks):
-    global eye_closed_start_time, gaze_away_start_time
-    score = 100
+# EAR計算に使う目の特徴点（左目6点 → 右目6点）
+EYE_IDS = scoring.EYE_INDEX.ravel().tolist()
 
-    # EAR（左目）
-    eye_ids = [33, 160, 158, 133, 153, 144]
-    eye_landmarks = np.array([[landmarks[i].x, landmarks[i].y] for i in eye_ids])
-    ear = calculate_EAR(eye_landmarks)
+
+# EARから目の閉じ時間による減点を計算
+def score_from_ear(ear, state):
+    score = 100
 
     # 目の閉じ時間による減点
     if ear < 0.25:
-        if eye_closed_start_time is None:
-            eye_closed_start_time = time.time()
-        duration = time.time() - eye_closed_start_time
+        if state.eye_closed_start_time is None:
+            state.eye_closed_start_time = time.monotonic()
+        duration = time.monotonic() - state.eye_closed_start_time
         score -= min(50, int((duration / 10.0) * 50))
     else:
-        eye_closed_start_time = None
+        state.eye_closed_start_time = None
 
-    print('debug2')
     return max(score, 0)
 
 
-def gen_frames(frame):
-    global face_missing_start_time
-    """
-    cap = cv2.VideoCapture(0)
-    while True:
-        success, frame = cap.read()
-        if not success:
-            continue #breakでした
-    """
-    # h, w = frame.shape[:2]
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    results = mp_face_mesh.process(rgb)
-
-    if results.multi_face_landmarks:
-        face_landmarks = results.multi_face_landmarks[0].landmark
-        score = calculate_focus_score(face_landmarks)
-
+# 推論結果（EAR、顔なしは None）から生徒のスコアを更新
+def update_score(state, ear):
+    if ear is not None:
+        score = score_from_ear(ear, state)
         # 顔が検出された → タイマーリセット
-        face_missing_start_time = None
-        drawing.draw_landmarks(frame, results.multi_face_landmarks[0], mp.solutions.face_mesh.FACEMESH_TESSELATION)
+        state.face_missing_start_time = None
     else:
         # 顔が検出されていない → タイマー開始
-        if face_missing_start_time is None:
-            face_missing_start_time = time.time()
-        duration = time.time() - face_missing_start_time
+        if state.face_missing_start_time is None:
+            state.face_missing_start_time = time.monotonic()
+        duration = time.monotonic() - state.face_missing_start_time
         if duration >= 5.0:
-            score = max(0, score_data["score"] - 50)
+            score = max(0, state.score - 50)
         else:
-            score = score_data["score"]
-
-    score_data["score"] = score
-
-    print('debug3')
-    return score_data
-    # time.sleep(0.5)
+            score = state.score
+
+    state.score = score
+    metrics.inc('frames_analyzed')
+    if ear is None:
+        metrics.inc('frames_no_face')
+    return score
+
+
+# 推論プール
+# INFERENCE_SOCKET を設定したときは推論デーモン（inference_daemon.py）に任せる
+# INFERENCE_WORKERS が 0 のときはこのプロセス内で直接処理
+inference_pool = None
+# 同時に推論中にできるバッチの数（推論ワーカーの数。このプロセス内で処理するときは1）
+INFERENCE_IN_FLIGHT = max(1, app.config.get('INFERENCE_WORKERS') or 0)
+# このプロセス内で推論するときのスレッド（FaceMeshは同時に呼べないので1つ）
+local_inference = None
+
+
+def get_inference_pool():
+    global inference_pool
+    if inference_pool is not None:
+        return inference_pool
+    socket_path = app.config.get('INFERENCE_SOCKET')
+    if socket_path:
+        from .inference_client import InferenceClient
+        inference_pool = InferenceClient(socket_path, connections=INFERENCE_IN_FLIGHT)
+        return inference_pool
+    workers = app.config.get('INFERENCE_WORKERS', 0)
+    if not workers:
+        return None
+    from .inference import InferencePool
+    inference_pool = InferencePool(workers, PIPELINE_OPTIONS)
+    return inference_pool
 
 
-def decode_base64_image(base64_string):
+# data URL / Base64文字列 → JPEGのバイト列
+def decode_base64_bytes(base64_string):
     if ';base64,' in base64_string:
         header, base64_string = base64_string.split(';base64,')
 
-    img_data = base64.b64decode(base64_string)
-
-    np_arr = np.frombuffer(img_data, np.uint8)
-
-    frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-    return frame
+    return base64.b64decode(base64_string)
+
+
+# フレームの変化による推論の省略（比較は推論するプロセスの中で行う。pipeline.py / motion.py）
+MOTION_GATE = app.config.get('MOTION_GATE', True)
+
+
+# [(user_id, JPEG)] → [(EAR, 段階ごとの処理時間, 推論を省略したか)]（このプロセス内で推論。デコードできない画像は顔なし）
+def analyze_jpegs_locally(images):
+    return get_face_pipeline().analyze_jpegs(images)
+
+
+# スケジューラから呼ばれる: [(user_id, JPEG)] をまとめて推論に投入し、
+# [(EAR, 段階ごとの処理時間, 推論を省略したか)] を返す Future を返す（完了は待たない）
+# items: [(user_id, (JPEGのバイト列, ルート))]
+def infer_frames(items):
+    global local_inference
+    images = [(user_id, image_bytes) for user_id, (image_bytes, _) in items]
+    metrics.inc('scheduler_batches')
+    metrics.inc('scheduler_frames', len(images))
+    pool = get_inference_pool()
+    if pool is not None:
+        # デコードとFaceMeshはワーカープロセスで実行（同じ生徒はいつも同じワーカー）
+        return pool.submit_batch(images)
+    if local_inference is None:
+        local_inference = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+    return local_inference.submit(analyze_jpegs_locally, images)
+
+
+# スケジューラから呼ばれる: 推論結果を生徒の状態に反映して (スコア, 次のキャプチャまでの間隔) を返す
+# 段階ごとの処理時間はフレームを送ってきたルートで記録する
+def finish_frame(user_id, payload, result):
+    _, route = payload
+    ear, stage_times, skipped = result
+    metrics.observe_stages(stage_times, route=route)
+    if MOTION_GATE:
+        metrics.inc('motion_skipped' if skipped else 'motion_inferred')
+    return apply_analysis(user_id, ear, inferred=not skipped, route=route)
+
+
+# 推論のスケジューラ（生徒ごとに最新のフレームだけを待たせ、まとめて推論する）
+frame_scheduler = FrameScheduler(infer_frames, finish_frame,
+                                 max_pending=app.config.get('SCHEDULER_MAX_PENDING', 64),
+                                 batch_size=app.config.get('SCHEDULER_BATCH_SIZE', 8),
+                                 max_in_flight=INFERENCE_IN_FLIGHT)
+atexit.register(frame_scheduler.close)
+
+
+# フレームをスケジューラに渡して、(スコア, 次のキャプチャまでの間隔) を返す Future を返す
+# route: 段階ごとの処理時間を記録するルート（省略時は現在のリクエストのルート）
+def submit_frame(user_id, image_bytes, route=None):
+    route = route if route is not None else metrics.current_route()
+    return frame_scheduler.submit(user_id, (image_bytes, route))
+
+
+# JPEGのバイト列を解析して生徒のスコアを返す（混み合っているときは Overloaded）
+def analyze_frame_bytes(user_id, image_bytes):
+    future = submit_frame(user_id, image_bytes)
+    with metrics.timed('inference'):
+        return future.result()
+
+
+# 混み合っているときのレスポンス（429。次のキャプチャは Retry-After 秒後）
+def overloaded_response(e):
+    response = jsonify({"success": False, "error": "サーバーが混み合っています。しばらくしてから再送してください",
+                        "next_interval_ms": e.retry_after * 1000})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+# 次のキャプチャまでの間隔（ミリ秒）
+CAPTURE_INTERVAL_MIN_MS = app.config.get('CAPTURE_INTERVAL_MIN_MS', 1000)
+CAPTURE_INTERVAL_BASE_MS = app.config.get('CAPTURE_INTERVAL_BASE_MS', 3000)
+CAPTURE_INTERVAL_MAX_MS = app.config.get('CAPTURE_INTERVAL_MAX_MS', 8000)
+CAPTURE_BACKOFF_AFTER = max(1, app.config.get('CAPTURE_BACKOFF_AFTER', 3))
+
+
+# 次のキャプチャまでの間隔を決める
+# 顔なし・目を閉じ始めた・スコアが下がった → 最短（変化を見逃さない）
+# 集中していてスコアが変わらない推論結果が CAPTURE_BACKOFF_AFTER 回続いた → 1.5倍ずつ伸ばす（推論の回数を減らす）
+# それ以外（非集中のまま・回復中・安定してまだ間もない） → 標準
+# 最初のフレームは比べる前回のスコアが無い（初期値の100）ので、安定とは数えない
+# inferred: False（推論を省略したフレーム）は前回のEARの使い回しなので、安定とは数えない
+def next_capture_interval(state, previous_score, score, ear, inferred=True):
+    if ear is None or state.eye_closed_start_time is not None or score < previous_score:
+        state.stable = 0
+        return CAPTURE_INTERVAL_MIN_MS
+    if score < 60 or score != previous_score:
+        state.stable = 0
+        return CAPTURE_INTERVAL_BASE_MS
+    if inferred and state.focused is not None:
+        state.stable += 1
+    if state.stable < CAPTURE_BACKOFF_AFTER:
+        return CAPTURE_INTERVAL_BASE_MS
+    interval = max(state.interval, CAPTURE_INTERVAL_BASE_MS) * 3 // 2
+    return min(interval, CAPTURE_INTERVAL_MAX_MS)
+
+
+# 推論結果（EAR、顔なしは None）を生徒の状態に反映して (スコア, 次のキャプチャまでの間隔) を返す
+# inferred: False なら推論を省略したフレーム（前回のEARを使い回しているので、間隔は縮めても伸ばさない）
+# route: 処理時間を記録するルート（省略時は現在のリクエストのルート）
+def apply_analysis(user_id, ear, inferred=True, route=None):
+    with metrics.timed('scoring', route), focus_states.locked(user_id) as state:
+        previous_score = state.score
+        score = update_score(state, ear)
+        interval = next_capture_interval(state, previous_score, score, ear, inferred)
+        if not inferred and state.interval:
+            interval = min(interval, state.interval)
+        state.interval = interval
+        focused = score >= 60
+        changed = state.focused != focused
+        state.focused = focused
+    counts = live_sessions.observe(user_id, focused, time.monotonic())
+
+    # 集中/非集中が切り替わったら先生用ダッシュボードに通知
+    if changed:
+        teacher_events.publish('focus', {'id': user_id, 'focus': 'focused' if focused else 'unfocused'})
+    if counts is not None:
+        now = time.time()
+        frame_series.append(counts[0], now, score, ear)
+        frame_rollups.add(counts[0], now, score, ear is not None)
+        record_focus_time(user_id, *counts)
+    return score, interval
+
+
+# サーバー側で数えた集中時間を保存し、分単位で変わったとき・アラート状態が変わったときに通知
+def record_focus_time(user_id, session_id, focus_seconds, unfocus_seconds):
+    # 書き込みは write-behind バッファで一定間隔にまとめる
+    update_user_session(session_id, int(focus_seconds), int(unfocus_seconds))
+
+    minutes = (int(focus_seconds) // 60, int(unfocus_seconds) // 60)
+    with focus_states.locked(user_id) as state:
+        minutes_changed = state.minutes != minutes
+        state.minutes = minutes
+    unfocus_rate = unfocus_rate_of(focus_seconds, unfocus_seconds)
+    if minutes_changed:
+        teacher_events.publish('minutes', {'id': user_id, 'focusMinutes': minutes[0],
+                                           'unfocusMinutes': minutes[1],
+                                           'unfocusRate': round(unfocus_rate, 1)})
+    publish_alert_change(user_id, needs_alert(focus_seconds, unfocus_seconds), unfocus_rate)
+
+
+# アラート状態が切り替わったときだけ先生用ダッシュボードに通知
+def publish_alert_change(user_id, needs_alert, unfocus_rate=0):
+    with focus_states.locked(user_id) as state:
+        changed = state.alerted != needs_alert
+        state.alerted = needs_alert
+    if changed:
+        teacher_events.publish('alert', {'id': user_id, 'needsAlert': needs_alert,
+                                         'unfocusRate': round(unfocus_rate, 1)})
+
+
+# スコア → 判定結果（next_interval_ms: 次のキャプチャまでの推奨間隔）
+def focus_result(score, interval=None):
+    result = {'focus': 'focused' if score >= 60 else 'unfocused'}
+    if interval is not None:
+        result['next_interval_ms'] = interval
+    return result
 
 
 #　全体のデータベース
+@metrics.timed('sqlite.create_user_db')
 def create_user_db():
     db_name = "all.db"
-    with sqlite3.connect(db_name) as conn:
+    with db.connection(db_name) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -333,13 +698,14 @@ def create_user_db():
         """)
         
 # 全体のデータベースに挿入(login時)
+@metrics.timed('sqlite.database_user_insert')
 def database_user_insert(username):
     db_name = "all.db"
     t = datetime.now()
     login_time = t.strftime("%H:%M:%S")
     d = date.today()
     date_time = d.strftime("%Y-%m-%d")
-    with sqlite3.connect(db_name) as conn:
+    with db.connection(db_name) as conn:
         cursor = conn.cursor()
     
         cursor.execute("""
@@ -348,11 +714,12 @@ def database_user_insert(username):
         """, (date_time,username, login_time))
 
 # 全体のデータベース更新
+@metrics.timed('sqlite.database_user_update')
 def database_user_update(username,teacher,con_time,no_con_time):
     db_name = "all.db"
     d = date.today()
     date_time = d.strftime("%Y-%m-%d")
-    with sqlite3.connect(db_name) as conn:
+    with db.connection(db_name) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             UPDATE users
@@ -361,12 +728,32 @@ def database_user_update(username,teacher,con_time,no_con_time):
         """, (teacher,con_time, no_con_time,date_time,username, ""))
         
         
+# ルートごとの処理時間を記録
+@app.before_request
+def start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop('request_start_time', None)
+    if start is not None:
+        metrics.observe('request', time.perf_counter() - start)
+    return response
+
+
+# レイテンシ計測結果（Prometheus形式）
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 # ログイン処理
 @app.route('/', methods=["GET", "POST"])
 def login():
     # 1.データベースの作成
     # データベースファイル名
-    db_filename = "TEST.db"
+    db_filename = DB_FILENAME
 
     table_create(db_filename)
 
@@ -402,10 +789,11 @@ def login():
 # 新規登録処理
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
-    db_filename = "TEST.db"
+    db_filename = DB_FILENAME
     username = None
     password = None
     user_type = None
+    table_create(db_filename)
     teachers = get_teacher_users(db_filename)
 
     if request.method == "POST":
@@ -443,6 +831,8 @@ def signup():
                     session['user_type'] = db_user_type
                     session['user_id'] = user_id
                     session['username'] = user_name
+                    if db_user_type == 'student':
+                        live_sessions.add_student(user_id, user_name)
                     # ユーザータイプに応じてリダイレクト
                     if db_user_type == 'teacher':
                         return redirect('/index_teacher', code=302)
@@ -459,6 +849,8 @@ def signup():
 # 3. ログアウト
 @app.route('/logout')
 def logout():
+    if 'user_id' in session:
+        focus_states.discard(session['user_id'])
     session.clear()
     return redirect('/', code=302)
 
@@ -466,29 +858,93 @@ def logout():
 # 生徒用ページ
 @app.route('/index_coolver', methods=['GET', 'POST'])
 def index():
-    db_filename = "TEST.db"
+    db_filename = DB_FILENAME
 
     if 'username' not in session or session.get('user_type') != 'student':
         return redirect('/', code=302)
 
     if request.method == 'POST':
-        data = request.json
+        with metrics.timed('json_parse'):
+            data = request.json
         
         if data is None:
             return jsonify({"error": "無効なjsonまたは空のデータ"}), 400
         # print(data)
-        image_data = data.get('image')
-        imd = decode_base64_image(image_data)
-        gen_frames(imd)
-        if score_data['score'] >= 60:
-            result = {'focus': 'focused'}
-        else:
-            result = {'focus': 'unfocused'}
-        return jsonify(result)
+        image_data = data.get('image') if isinstance(data, dict) else None
+        if not isinstance(image_data, str):
+            return jsonify({"error": "画像データがありません"}), 400
+        with metrics.timed('base64_decode'):
+            try:
+                image_bytes = decode_base64_bytes(image_data)
+            except ValueError:
+                return jsonify({"error": "画像データのBase64が不正です"}), 400
+        if not image_bytes:
+            return jsonify({"error": "画像データがありません"}), 400
+        try:
+            score, interval = analyze_frame_bytes(session['user_id'], image_bytes)
+        except Overloaded as e:
+            return overloaded_response(e)
+        return jsonify(focus_result(score, interval))
 
 
     teachers = get_teacher_users(db_filename)
-    return render_template('index_coolver.html', username=session.get('username'), teachers=teachers)
+    return render_template('index_coolver.html', username=session.get('username'), teachers=teachers,
+                           eye_ids=EYE_IDS, client_landmarks=app.config.get('CLIENT_LANDMARKS', False))
+
+
+# 生徒用フレーム送信API（JPEGをそのまま受け取る）
+@app.route('/api/frame', methods=['POST'])
+def api_frame():
+    if 'username' not in session or session.get('user_type') != 'student':
+        return jsonify({"success": False, "error": "未ログインまたは権限がありません"}), 401
+
+    if request.mimetype == 'multipart/form-data':
+        # FormData で Blob を送ってきた場合
+        upload = request.files.get('image')
+        image_bytes = upload.read() if upload else b''
+    else:
+        # Content-Type: image/jpeg の生データ（ストリームから直接読む）
+        image_bytes = request.get_data(cache=False)
+
+    if not image_bytes:
+        return jsonify({"success": False, "error": "画像データがありません"}), 400
+
+    try:
+        score, interval = analyze_frame_bytes(session['user_id'], image_bytes)
+    except Overloaded as e:
+        return overloaded_response(e)
+    return jsonify(focus_result(score, interval))
+
+
+# 生徒用特徴点送信API（ブラウザ側でFace Meshを実行した場合）
+@app.route('/api/landmarks', methods=['POST'])
+def api_landmarks():
+    if 'username' not in session or session.get('user_type') != 'student':
+        return jsonify({"success": False, "error": "未ログインまたは権限がありません"}), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "error": "無効なjsonまたは空のデータ"}), 400
+
+    # eye: EYE_IDS 順の目の特徴点 [[x, y], ...]（左目6点のみも可、顔なしは null）
+    eye = data.get('eye')
+    ear = None
+    if eye is not None:
+        try:
+            eye_landmarks = np.asarray(eye, dtype=np.float64)
+        except (TypeError, ValueError):
+            eye_landmarks = None
+        if eye_landmarks is None or eye_landmarks.shape not in ((12, 2), (6, 2)) \
+                or not np.isfinite(eye_landmarks).all():
+            return jsonify({"success": False, "error": "特徴点の形式が不正です"}), 400
+        with metrics.timed('features'):
+            ear = float(scoring.ear_from_eye_points(eye_landmarks.reshape(-1, 6, 2)).mean())
+        # 目の横幅が0（全点が同じ座標など）だとEARが求まらない
+        if not np.isfinite(ear):
+            return jsonify({"success": False, "error": "特徴点の形式が不正です"}), 400
+
+    score, interval = apply_analysis(session['user_id'], ear)
+    return jsonify(focus_result(score, interval))
 
 
 # 先生用ページ
@@ -518,74 +974,204 @@ def teacher_dashboard():
 
 #先生用API
 
+# 非集中の割合がこれを超えたらアラート（%）
+ALERT_UNFOCUS_RATE = 25
+# セッション開始直後の数回の判定だけでアラートにしないよう、これだけ数えてから判定する（秒）
+ALERT_MIN_SECONDS = 60
+
+
+# 非集中の割合（%）
+def unfocus_rate_of(focus_seconds, unfocus_seconds):
+    total = focus_seconds + unfocus_seconds
+    return (unfocus_seconds / total * 100) if total > 0 else 0
+
+
+# アラートを出すか
+def needs_alert(focus_seconds, unfocus_seconds):
+    if focus_seconds + unfocus_seconds < ALERT_MIN_SECONDS:
+        return False
+    return unfocus_rate_of(focus_seconds, unfocus_seconds) > ALERT_UNFOCUS_RATE
+
+
+# 名簿とセッション中の生徒をメモリに読み込む（初回だけSQLiteを読む）
+def load_live_sessions():
+    live_sessions.ensure_loaded(lambda: get_all_students(DB_FILENAME), get_active_sessions)
+
+
+#先生用ダッシュボードの生徒1人分のデータ（live: セッション中なら LiveSession）
+def student_entry(user_id, username, live):
+    if live:
+        focus = None
+        if live.focused is not None:
+            focus = 'focused' if live.focused else 'unfocused'
+        focus_min = int(live.focus_seconds) // 60
+        unfocus_min = int(live.unfocus_seconds) // 60
+        unfocus_rate = unfocus_rate_of(live.focus_seconds, live.unfocus_seconds)
+        
+        return {
+            'id': user_id,
+            'name': username,
+            'isOnline': True,
+            'focus': focus,
+            'focusMinutes': focus_min,
+            'unfocusMinutes': unfocus_min,
+            'unfocusRate': round(unfocus_rate, 1),
+            'needsAlert': needs_alert(live.focus_seconds, live.unfocus_seconds),
+            'loginTime': live.start_time,
+            'logoutTime': None,
+            'tags': [],
+            'memo': ''
+        }
+    return {
+        'id': user_id,
+        'name': username,
+        'isOnline': False,
+        'focus': None,
+        'focusMinutes': 0,
+        'unfocusMinutes': 0,
+        'unfocusRate': 0,
+        'needsAlert': False,
+        'loginTime': None,
+        'logoutTime': None,
+        'tags': [],
+        'memo': ''
+    }
+
+
 #全生徒の現在の状態を取得"
 @app.route('/api/teacher/students', methods=['GET'])
 def api_teacher_students():
     if 'username' not in session or session.get('user_type') != 'teacher':
         return jsonify({"success": False, "error": "権限がありません"}), 403
     
-    db_filename = "TEST.db"
-    students_list = get_all_students(db_filename)
-    
-    result = []
-    for user_id, username in students_list:
-        active_session = get_user_active_session(username)
-        
-        if active_session:
-            focus_min = active_session['focus_seconds'] // 60
-            unfocus_min = active_session['unfocus_seconds'] // 60
-            total = active_session['focus_seconds'] + active_session['unfocus_seconds']
-            unfocus_rate = (active_session['unfocus_seconds'] / total * 100) if total > 0 else 0
-            
-            result.append({
-                'id': user_id,
-                'name': username,
-                'isOnline': True,
-                'focusMinutes': focus_min,
-                'unfocusMinutes': unfocus_min,
-                'unfocusRate': round(unfocus_rate, 1),
-                'needsAlert': unfocus_rate > 25,
-                'loginTime': active_session['start_time'],
-                'logoutTime': None,
-                'tags': [],
-                'memo': ''
-            })
-        else:
-            result.append({
-                'id': user_id,
-                'name': username,
-                'isOnline': False,
-                'focusMinutes': 0,
-                'unfocusMinutes': 0,
-                'unfocusRate': 0,
-                'needsAlert': False,
-                'loginTime': None,
-                'logoutTime': None,
-                'tags': [],
-                'memo': ''
-            })
+    load_live_sessions()
+    result = [student_entry(user_id, username, live)
+              for user_id, username, live in live_sessions.students()]
     
     return jsonify({"success": True, "students": result})
 
+#生徒の状態の変化をプッシュ配信（Server-Sent Events）
+@app.route('/api/teacher/events', methods=['GET'])
+def api_teacher_events():
+    if 'username' not in session or session.get('user_type') != 'teacher':
+        return jsonify({"success": False, "error": "権限がありません"}), 403
+
+    heartbeat = app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+
+    def stream():
+        subscription = teacher_events.subscribe()
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                events = subscription.wait(heartbeat)
+                if not events:
+                    # 接続維持用のコメント行
+                    yield ': ping\n\n'
+                    continue
+                yield ''.join(format_sse(*event) for event in events)
+        finally:
+            teacher_events.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ページ送りのカーソル ⇔ (start_time, session_id)
+def encode_history_cursor(row):
+    return base64.urlsafe_b64encode(json.dumps([row['start_time'], row['session_id']]).encode()).decode()
+
+
+def decode_history_cursor(cursor):
+    start_time, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return str(start_time), int(session_id)
+
+
+#クエリ文字列の from / to（開始日の範囲、YYYY-MM-DD、to の日を含む）
+#→ start_time と比べる (以上, 未満)（不正な日付は ValueError）
+def date_range_args():
+    start = request.args.get('from')
+    end = request.args.get('to')
+    if start:
+        start = date.fromisoformat(start).isoformat()
+    if end:
+        end = (date.fromisoformat(end) + timedelta(days=1)).isoformat()
+    return start, end
+
+#履歴の検索条件（クエリ文字列）を読んで1ページ分を返す
+#  from / to: 開始日の範囲 / teacher: 先生の名前 / limit: 件数（最大100） / cursor: 前のページの next_cursor
+def history_page(user_id=None):
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+        start, end = date_range_args()
+        cursor = request.args.get('cursor')
+        after = decode_history_cursor(cursor) if cursor else None
+    except (ValueError, TypeError):
+        return jsonify({"success": False, "error": "検索条件が正しくありません"}), 400
+
+    # 1件多く読んで次のページがあるかを判定
+    rows = query_history(user_id=user_id, teacher_name=request.args.get('teacher'),
+                         start=start, end=end, after=after, limit=limit + 1)
+    next_cursor = encode_history_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return jsonify({"success": True, "history": rows[:limit], "next_cursor": next_cursor})
+
 #指定した生徒の履歴を取得
 @app.route('/api/teacher/student-history/<int:student_id>', methods=['GET'])
 def api_teacher_student_history(student_id):
     if 'username' not in session or session.get('user_type') != 'teacher':
         return jsonify({"success": False, "error": "権限がありません"}), 403
     
-    db_filename = "TEST.db"
+    db_filename = DB_FILENAME
     
     # user_idから生徒名を取得
-    with sqlite3.connect(db_filename) as conn:
+    with metrics.timed('sqlite.get_username'), db.connection(db_filename) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM users WHERE user_id = ?", (student_id,))
         row = cursor.fetchone()
         if not row:
             return jsonify({"success": False, "error": "生徒が見つかりません"}), 404
-        username = row[0]
     
-    history = get_user_history(username, limit=10)
-    return jsonify({"success": True, "history": history})
+    return history_page(student_id)
+
+#全生徒の履歴を取得
+@app.route('/api/teacher/history', methods=['GET'])
+def api_teacher_history():
+    if 'username' not in session or session.get('user_type') != 'teacher':
+        return jsonify({"success": False, "error": "権限がありません"}), 403
+
+    return history_page()
+
+#クラス全体の集計（平均集中率・アラート件数・分布・集中率の低い生徒）
+#  from / to: 開始日の範囲 / teacher: 先生の名前（既定はログイン中の先生、all で全員） / top: 集中率の低い生徒の人数
+@app.route('/api/teacher/analytics', methods=['GET'])
+def api_teacher_analytics():
+    if 'username' not in session or session.get('user_type') != 'teacher':
+        return jsonify({"success": False, "error": "権限がありません"}), 403
+
+    try:
+        start, end = date_range_args()
+        top_n = min(max(int(request.args.get('top', 5)), 1), 100)
+    except (ValueError, TypeError):
+        return jsonify({"success": False, "error": "検索条件が正しくありません"}), 400
+    teacher_name = request.args.get('teacher', session['username'])
+    if teacher_name == 'all':
+        teacher_name = None
+
+    sessions_array = load_class_sessions(teacher_name, start, end)
+    with metrics.timed('analytics'):
+        summary = analytics.class_summary(sessions_array, top_n, ALERT_UNFOCUS_RATE, ALERT_MIN_SECONDS)
+
+    load_live_sessions()
+    for student in summary['least_focused']:
+        student['name'] = live_sessions.name(student['user_id'])
+    return jsonify({"success": True, "teacher": teacher_name, "analytics": summary})
+
+#セッションの1分ごとの集中度（グラフ用）
+@app.route('/api/teacher/session-chart/<int:session_id>', methods=['GET'])
+def api_teacher_session_chart(session_id):
+    if 'username' not in session or session.get('user_type') != 'teacher':
+        return jsonify({"success": False, "error": "権限がありません"}), 403
+
+    # 進行中のセッションは書き込み間隔（SESSION_FLUSH_SECONDS）分だけ遅れて反映される
+    return jsonify({"success": True, "session_id": session_id, "minutes": get_session_minutes(session_id)})
 
 #メッセージを送信
 @app.route('/api/teacher/send-message', methods=['POST'])
@@ -619,14 +1205,23 @@ def api_start_session():
     
     username = session.get('username')
     
-    # 生徒個別DBにセッション開始記録
-    session_id = start_user_session(username, teacher_name)
+    # セッション開始記録
+    session_id = start_user_session(session['user_id'], teacher_name)
     
     # Flaskセッションに保存
     session['current_session_id'] = session_id
     session['session_start_time'] = start_time
     
     print(f"セッション開始: {username} → 先生: {teacher_name} (session_id: {session_id})")
+
+    # 新しいセッションでは最初の判定も通知する
+    user_id = session['user_id']
+    with focus_states.locked(user_id) as state:
+        state.focused = None
+        state.minutes = None
+    load_live_sessions()
+    live = live_sessions.start(user_id, username, session_id, teacher_name, datetime.now().isoformat())
+    teacher_events.publish('session_start', student_entry(user_id, username, live))
     
     return jsonify({
         "success": True,
@@ -634,6 +1229,15 @@ def api_start_session():
         "message": "セッション開始しました"
     })
 
+# クライアントから送られた秒数 → 0以上の整数（数値でなければ 0）
+def seconds_arg(value):
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return 0
+    return int(seconds) if seconds > 0 and seconds != float('inf') else 0
+
+
 #セッション終了（記録保存）
 @app.route('/api/end-session', methods=['POST'])
 def api_end_session():
@@ -644,28 +1248,45 @@ def api_end_session():
     teacher_name = data.get('teacher_name', '先生なし')
     start_time = data.get('start_time')
     end_time = data.get('end_time')
-    focus_seconds = data.get('focus_seconds', 0)
-    unfocus_seconds = data.get('unfocus_seconds', 0)
+    focus_seconds = seconds_arg(data.get('focus_seconds'))
+    unfocus_seconds = seconds_arg(data.get('unfocus_seconds'))
     tags = data.get('tags', '')
     memo = data.get('memo', '')
     
     username = session.get('username')
     session_id = session.get('current_session_id')
+    user_id = session['user_id']
+
+    # 集中時間はサーバー側で数えた値を使う（クライアントの値はセッションを数えていない場合だけ）
+    live = live_sessions.end(user_id)
+    if live is not None and live.session_id == session_id:
+        focus_seconds = int(live.focus_seconds)
+        unfocus_seconds = int(live.unfocus_seconds)
     
     if session_id:
-        # 既存のセッションを更新
-        end_user_session(username, session_id, tags, memo)
-        # 集中時間も更新
-        update_user_session(username, session_id, focus_seconds, unfocus_seconds)
+        # 既存のセッションを更新（集中時間を更新してから終了）
+        update_user_session(session_id, focus_seconds, unfocus_seconds)
+        end_user_session(session_id, tags, memo)
+        frame_series.flush(session_id)
+        frame_rollups.end(session_id)
         session.pop('current_session_id', None)
     else:
         # 新規セッションとして保存
-        session_id = start_user_session(username, teacher_name)
-        update_user_session(username, session_id, focus_seconds, unfocus_seconds)
-        end_user_session(username, session_id, tags, memo)
+        session_id = start_user_session(session['user_id'], teacher_name)
+        update_user_session(session_id, focus_seconds, unfocus_seconds)
+        end_user_session(session_id, tags, memo)
     
     print(f"セッション終了: {username} (session_id: {session_id})")
     print(f"   集中: {focus_seconds}秒, 非集中: {unfocus_seconds}秒")
+
+    entry = student_entry(user_id, username, None)
+    entry.update({
+        'focusMinutes': int(focus_seconds) // 60,
+        'unfocusMinutes': int(unfocus_seconds) // 60,
+        'logoutTime': datetime.now().isoformat(),
+    })
+    publish_alert_change(user_id, False)
+    teacher_events.publish('session_end', entry)
     
     return jsonify({
         "success": True,
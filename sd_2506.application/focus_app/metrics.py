@@ -0,0 +1,119 @@
+# metrics.py
+# 場所: focus_app/metrics.py
+#
+# 処理段階ごとのレイテンシ計測（ヒストグラム）とカウンタ
+# /metrics で Prometheus のテキスト形式で出力する
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+
+# ヒストグラムのバケット上限（秒）
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_METRIC = 'focus_stage_duration_seconds'
+COUNTER_METRIC = 'focus_events_total'
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        # 最後の要素は +Inf
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+# 現在のリクエストのルート（URLルールのパターン。リクエスト外は '-'）
+def current_route():
+    if not has_request_context():
+        return '-'
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def observe(stage, seconds, route=None):
+    key = (route if route is not None else current_route(), stage)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(seconds)
+
+
+# ワーカーなど別の場所で計った (stage, 秒) の列をまとめて記録
+def observe_stages(stage_times, route=None):
+    route = route if route is not None else current_route()
+    for stage, seconds in stage_times:
+        observe(stage, seconds, route)
+
+
+# with timed('stage'): ... または @timed('stage') で処理時間を記録
+@contextmanager
+def timed(stage, route=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, route)
+
+
+def inc(event, amount=1):
+    with _lock:
+        _counters[event] = _counters.get(event, 0) + amount
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_le(bound):
+    return repr(float(bound))
+
+
+# Prometheus テキスト形式に変換
+def render():
+    with _lock:
+        histograms = [(key, list(h.counts), h.total, h.count) for key, h in _histograms.items()]
+        counters = list(_counters.items())
+
+    lines = [
+        f'# HELP {STAGE_METRIC} Latency of each request/analysis stage.',
+        f'# TYPE {STAGE_METRIC} histogram',
+    ]
+    for (route, stage), counts, total, count in sorted(histograms):
+        labels = f'route="{_escape(route)}",stage="{_escape(stage)}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS, counts):
+            cumulative += n
+            lines.append(f'{STAGE_METRIC}_bucket{{{labels},le="{_format_le(bound)}"}} {cumulative}')
+        lines.append(f'{STAGE_METRIC}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f'{STAGE_METRIC}_sum{{{labels}}} {total}')
+        lines.append(f'{STAGE_METRIC}_count{{{labels}}} {count}')
+
+    lines.append(f'# HELP {COUNTER_METRIC} Count of analysis events.')
+    lines.append(f'# TYPE {COUNTER_METRIC} counter')
+    for event, n in sorted(counters):
+        lines.append(f'{COUNTER_METRIC}{{event="{_escape(event)}"}} {n}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
@@ -0,0 +1,100 @@
+# migrate_user_dbs.py
+# 場所: focus_app/migrate_user_dbs.py
+#
+# 生徒ごとのデータベース（{username}.db）の学習セッションを
+# 1つのデータベース（config.DATABASE の learning_sessions テーブル）に取り込む
+# 取り込んだファイルは {username}.db.migrated に名前を変えるので、再実行しても二重に取り込まない
+#
+# 使い方（サーバーと同じディレクトリで実行）:
+#   python -m focus_app.migrate_user_dbs
+#   python -m focus_app.migrate_user_dbs --dir 古いDBのディレクトリ --dry-run
+
+import argparse
+import glob
+import os
+import sqlite3
+
+from . import db
+from .main import DB_FILENAME, table_create
+
+# 生徒ごとのDBではないファイル
+SKIP_FILES = {'all.db'}
+
+SESSION_COLUMNS = ('teacher_name', 'start_time', 'end_time', 'focus_seconds',
+                   'unfocus_seconds', 'tags', 'memo', 'is_active')
+
+
+# 生徒ごとのDBから学習セッションを読む（learning_sessions が無ければ None）
+def read_user_sessions(path):
+    with sqlite3.connect(f'file:{path}?mode=ro', uri=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'learning_sessions'")
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute(f"SELECT {', '.join(SESSION_COLUMNS)} FROM learning_sessions ORDER BY session_id")
+        return cursor.fetchall()
+
+
+def migrate(directory, database, dry_run=False):
+    table_create(database)
+    database_path = os.path.abspath(database)
+    imported_files = 0
+    imported_sessions = 0
+
+    with db.connection(database) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name, user_id FROM users WHERE user_type = 'student'")
+        user_ids = dict(cursor.fetchall())
+
+        for path in sorted(glob.glob(os.path.join(directory, '*.db'))):
+            filename = os.path.basename(path)
+            if os.path.abspath(path) == database_path or filename in SKIP_FILES:
+                continue
+
+            username = filename[:-len('.db')]
+            user_id = user_ids.get(username)
+            if user_id is None:
+                print(f"⚠️  {filename}: 生徒 {username} が登録されていないのでスキップします")
+                continue
+
+            rows = read_user_sessions(path)
+            if rows is None:
+                print(f"ℹ️  {filename}: learning_sessions テーブルが無いのでスキップします")
+                continue
+
+            print(f"📥 {filename}: {len(rows)} 件（user_id={user_id}）")
+            if dry_run:
+                continue
+
+            # ファイル単位でまとめてコミットする
+            with conn:
+                conn.executemany(f"""
+                    INSERT INTO learning_sessions (user_id, {', '.join(SESSION_COLUMNS)})
+                    VALUES (?, {', '.join('?' * len(SESSION_COLUMNS))})
+                """, [(user_id, *row) for row in rows])
+            os.rename(path, path + '.migrated')
+            imported_files += 1
+            imported_sessions += len(rows)
+
+    return imported_files, imported_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生徒ごとのDBの学習セッションを1つのデータベースに取り込む')
+    parser.add_argument('--dir', default='.', help='生徒ごとのDB（{username}.db）があるディレクトリ')
+    parser.add_argument('--database', default=DB_FILENAME, help='取り込み先のデータベース')
+    parser.add_argument('--dry-run', action='store_true', help='件数の表示だけして取り込まない')
+    args = parser.parse_args()
+
+    print("🔧 学習セッションの移行")
+    print("=" * 50)
+    files, sessions = migrate(args.dir, args.database, args.dry_run)
+    print("=" * 50)
+    if args.dry_run:
+        print("ℹ️  --dry-run のため取り込んでいません")
+    else:
+        print(f"✅ {files} ファイル・{sessions} 件のセッションを {args.database} に取り込みました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# motion.py
+# 場所: focus_app/motion.py
+#
+# フレームの変化の検出（FaceMeshを省略するかどうかの判定用）
+# JPEGを1/8の大きさのグレースケールで直接デコードし（IDCTの段階で縮小されるので軽い）、
+# さらに小さなサムネイルにして、前回推論したフレームのサムネイルとの平均の差を比べる
+# 推論するプロセス（推論ワーカー・推論デーモン）の中で使う（Webサーバーは cv2 を読み込まない）
+
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# サムネイルの一辺（ピクセル）
+THUMBNAIL_SIZE = 32
+
+
+# JPEGのバイト列 → 比較用のサムネイル（デコードできなければ None）
+def thumbnail(image_bytes):
+    small = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    return cv2.resize(small, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+
+
+# 2枚のサムネイルの差（画素ごとの差の絶対値の平均。0〜255）
+def difference(previous, current):
+    return float(cv2.absdiff(previous, current).mean())
+
+
+class MotionGate:
+    """
+    生徒ごとに、前回FaceMeshで推論したフレームのサムネイルとEARを持ち、
+    次のフレームがほとんど変わっていなければ推論を省略して前回のEARを使う
+    threshold: サムネイルの差（difference）がこれ未満なら変化なしとみなす
+    max_skips: 続けて省略する最大回数
+    max_age: 前回の推論からこの秒数以上たったフレームは変化がなくても推論する
+    max_entries: 覚えておく生徒の数（超えたら最も長くフレームの来ていない生徒から忘れる）
+    """
+
+    def __init__(self, threshold=1.0, max_skips=2, max_age=10.0, max_entries=1024):
+        self.threshold = threshold
+        self.max_skips = max_skips
+        self.max_age = max_age
+        self.max_entries = max_entries
+        # 生徒 → [サムネイル, EAR, 推論した時刻, 省略した回数]。最近フレームの来たものほど後ろ
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # 推論を省略できれば (True, 前回のEAR)、推論が必要なら (False, None)
+    def check(self, key, thumb):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            self._entries.move_to_end(key)
+            previous, ear, inferred_at, skips = entry
+            if skips >= self.max_skips or time.monotonic() - inferred_at >= self.max_age \
+                    or difference(previous, thumb) >= self.threshold:
+                return False, None
+            entry[3] = skips + 1
+            return True, ear
+
+    # 推論したフレームのサムネイルとEARを次の比較のために残す
+    def remember(self, key, thumb, ear):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = [thumb, ear, time.monotonic(), 0]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,244 @@
+# pipeline.py
+# 場所: focus_app/pipeline.py
+#
+# JPEG → EAR の推論パイプライン（段階ごとに有効/無効を切り替えられる）
+#   0. 変化の検出: 生徒の前回推論したフレームからほとんど変わっていなければ、以降を省略して前回のEARを使う（motion.py）
+#   1. 縮小デコード: IMREAD_REDUCED_COLOR_N でJPEGを 1/N の大きさで直接デコード
+#   2. 顔検出: 軽い顔検出器（BlazeFace）で顔の範囲を求め、その周りだけを切り出す
+#      顔が見つからなければFaceMeshは実行しない
+#   3. FaceMesh: 切り出した範囲（または画像全体）で特徴点を求める
+#      虹彩の精密化（refine_landmarks）は判定に使う特徴量が虹彩の点を必要とするときだけ
+#      FaceMeshは前のフレームの特徴点から顔を追跡する（トラッキング）ので、生徒ごとに別のFaceMeshを使う
+#      （1つを全員で使うと、前のフレームが別の生徒の顔なので毎回顔検出からやり直しになり、見失うこともある）
+# 特徴点は切り出す前の画像に対する正規化座標に戻すので、EARの値は切り出しの有無によらない
+
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from . import motion
+from . import scoring
+
+# 縮小の倍率 → imdecode のフラグ
+DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+# FaceMesh 1つあたりのおおよそのメモリ（MB。モデルと計算グラフ）
+FACEMESH_INSTANCE_MB = 20
+
+
+class FaceMeshCache:
+    """
+    生徒ごとのFaceMesh（トラッキングの状態を生徒ごとに持つ）
+    create(): FaceMeshを作る関数
+    max_entries: 持っておく最大数（超えたら最も長く使われていないものを閉じる）
+    idle_timeout: この秒数使われていないものは閉じる
+    FaceMesh自体は同時に呼べないので、取り出したものは1つのスレッドから使う
+    """
+
+    def __init__(self, create, max_entries=16, idle_timeout=120, sweep_interval=30):
+        self._create = create
+        self.max_entries = max_entries
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        # 生徒 → (FaceMesh, 最後に使った時刻)。最近使ったものほど後ろ
+        self._meshes = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def get(self, key):
+        now = time.monotonic()
+        closing = []
+        with self._lock:
+            entry = self._meshes.pop(key, None)
+            face_mesh = entry[0] if entry is not None else self._create()
+            self._meshes[key] = (face_mesh, now)
+            while len(self._meshes) > self.max_entries:
+                closing.append(self._meshes.popitem(last=False)[1][0])
+            if now - self._last_sweep > self.sweep_interval:
+                self._last_sweep = now
+                deadline = now - self.idle_timeout
+                # 古い順に並んでいるので、期限内のものが出てきたらそこまで
+                while self._meshes:
+                    oldest = next(iter(self._meshes))
+                    if self._meshes[oldest][1] >= deadline:
+                        break
+                    closing.append(self._meshes.pop(oldest)[0])
+        for old in closing:
+            old.close()
+        return face_mesh
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._meshes.pop(key, None)
+        if entry is not None:
+            entry[0].close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._meshes)
+
+
+class FacePipeline:
+    """
+    decode_scale: JPEGを 1/decode_scale の大きさでデコード（1, 2, 4, 8）
+    face_detector: 顔検出器で顔の範囲を切り出してからFaceMeshにかける
+    refine_landmarks: 虹彩の精密化（None なら scoring.USES_IRIS に従う）
+    crop_margin: 切り出すときに顔の範囲の周りに足す余白（顔の大きさに対する割合）
+    facemesh_cache_mb: 生徒ごとのFaceMeshに使うメモリの上限（MB。0 なら全員で1つのFaceMeshを使う）
+    facemesh_idle_seconds: この秒数フレームの来ない生徒のFaceMeshは閉じる
+    motion_threshold: 前回推論したフレームとの差がこれ未満なら推論を省略（None なら省略しない）
+    motion_max_skips / motion_max_age: 続けて省略する最大回数 / 前回の推論から必ず推論し直すまでの秒数
+    """
+
+    def __init__(self, decode_scale=1, face_detector=False, refine_landmarks=None, crop_margin=0.4,
+                 facemesh_cache_mb=0, facemesh_idle_seconds=120,
+                 motion_threshold=None, motion_max_skips=2, motion_max_age=10.0):
+        if decode_scale not in DECODE_FLAGS:
+            raise ValueError(f"decode_scale は {sorted(DECODE_FLAGS)} のいずれかです: {decode_scale}")
+        self.decode_scale = decode_scale
+        self.refine_landmarks = scoring.USES_IRIS if refine_landmarks is None else refine_landmarks
+        self.crop_margin = crop_margin
+        self.face_mesh = self.create_face_mesh()
+        self.face_meshes = None
+        if facemesh_cache_mb:
+            self.face_meshes = FaceMeshCache(self.create_face_mesh,
+                                             max_entries=max(1, facemesh_cache_mb // FACEMESH_INSTANCE_MB),
+                                             idle_timeout=facemesh_idle_seconds)
+        self.motion_gate = None
+        if motion_threshold is not None:
+            self.motion_gate = motion.MotionGate(motion_threshold, motion_max_skips, motion_max_age)
+        self.face_detection = None
+        if face_detector:
+            # カメラから2m以内の顔向けの軽いモデル
+            self.face_detection = mp.solutions.face_detection.FaceDetection(
+                model_selection=0, min_detection_confidence=0.5)
+
+    def create_face_mesh(self):
+        return mp.solutions.face_mesh.FaceMesh(refine_landmarks=self.refine_landmarks)
+
+    # 生徒のFaceMesh（生徒の指定が無い・キャッシュを使わない設定なら共有のもの）
+    def face_mesh_for(self, key):
+        if key is None or self.face_meshes is None:
+            return self.face_mesh
+        return self.face_meshes.get(key)
+
+    # JPEGのバイト列 → BGR画像（空・デコードできなければ None）
+    def decode(self, image_bytes):
+        if not image_bytes:
+            return None
+        return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), DECODE_FLAGS[self.decode_scale])
+
+    # 顔の範囲 (x0, y0, x1, y1)（ピクセル。顔が無ければ None）
+    def face_region(self, rgb):
+        results = self.face_detection.process(rgb)
+        if not results.detections:
+            return None
+        detection = max(results.detections, key=lambda d: d.score[0])
+        box = detection.location_data.relative_bounding_box
+        h, w = rgb.shape[:2]
+        # FaceMeshの入力は正方形なので、余白を足した正方形で切り出す
+        cx = (box.xmin + box.width / 2) * w
+        cy = (box.ymin + box.height / 2) * h
+        half = max(box.width * w, box.height * h) * (0.5 + self.crop_margin)
+        x0, y0 = max(0, int(cx - half)), max(0, int(cy - half))
+        x1, y1 = min(w, int(cx + half)), min(h, int(cy + half))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+        return x0, y0, x1, y1
+
+    # BGR画像 → 特徴点 (N, 3)（画像全体に対する正規化座標。scoring.FEATURE_IDS 以外は NaN。顔が無ければ None）
+    # stage_times を渡すと段階ごとの処理時間 (stage, 秒) を追加する
+    # key: 生徒（生徒ごとのFaceMeshでトラッキングする）
+    def landmarks(self, frame, stage_times=None, key=None):
+        stage_times = stage_times if stage_times is not None else []
+        t0 = time.perf_counter()
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        t1 = time.perf_counter()
+        stage_times.append(('cvtColor', t1 - t0))
+
+        h, w = rgb.shape[:2]
+        x0, y0, x1, y1 = 0, 0, w, h
+        if self.face_detection is not None:
+            region = self.face_region(rgb)
+            t2 = time.perf_counter()
+            stage_times.append(('face_detection', t2 - t1))
+            t1 = t2
+            if region is None:
+                return None
+            x0, y0, x1, y1 = region
+            rgb = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+
+        results = self.face_mesh_for(key).process(rgb)
+        t2 = time.perf_counter()
+        stage_times.append(('facemesh', t2 - t1))
+        if not results.multi_face_landmarks:
+            return None
+
+        points = scoring.landmarks_to_points(results.multi_face_landmarks[0])
+        if (x0, y0, x1, y1) != (0, 0, w, h):
+            # 切り出した範囲の座標 → 画像全体の座標（取り出した特徴点だけ）
+            ids = scoring.FEATURE_IDS
+            points[ids, 0] = (x0 + points[ids, 0] * (x1 - x0)) / w
+            points[ids, 1] = (y0 + points[ids, 1] * (y1 - y0)) / h
+        return points
+
+    # BGR画像 → 両目の平均EAR（顔が無ければ None）
+    def ear(self, frame, stage_times=None, key=None):
+        stage_times = stage_times if stage_times is not None else []
+        points = self.landmarks(frame, stage_times, key)
+        if points is None:
+            return None
+        t0 = time.perf_counter()
+        ear = float(scoring.compute_features(points)['ear'])
+        stage_times.append(('features', time.perf_counter() - t0))
+        return ear
+
+    # JPEG → (EAR（顔が無ければ None）, 段階ごとの処理時間)
+    def analyze_jpeg(self, image_bytes, key=None):
+        stage_times = []
+        t0 = time.perf_counter()
+        frame = self.decode(image_bytes)
+        stage_times.append(('imdecode', time.perf_counter() - t0))
+        if frame is None:
+            return None, stage_times
+        return self.ear(frame, stage_times, key), stage_times
+
+    # 生徒のJPEG → (EAR, 段階ごとの処理時間, 推論を省略したか)
+    # 前回推論したフレームからほとんど変わっていなければ、推論せずに前回のEARを返す
+    def analyze_frame(self, image_bytes, key=None):
+        stage_times = []
+        thumb = None
+        if self.motion_gate is not None and key is not None and image_bytes:
+            t0 = time.perf_counter()
+            thumb = motion.thumbnail(image_bytes)
+            stage_times.append(('motion', time.perf_counter() - t0))
+            if thumb is not None:
+                skipped, ear = self.motion_gate.check(key, thumb)
+                if skipped:
+                    return ear, stage_times, True
+        ear, inference_times = self.analyze_jpeg(image_bytes, key)
+        if thumb is not None:
+            self.motion_gate.remember(key, thumb, ear)
+        return ear, stage_times + inference_times, False
+
+    # [(生徒, JPEG)] → [(EAR, 段階ごとの処理時間, 推論を省略したか)]
+    # 1枚の推論でエラーが起きても、そのフレームを顔なしとして扱い、同じバッチの他の生徒には影響させない
+    def analyze_jpegs(self, items):
+        results = []
+        for key, image_bytes in items:
+            try:
+                results.append(self.analyze_frame(image_bytes, key))
+            except Exception as e:
+                print("フレームの推論中にエラーが発生しました:", e)
+                results.append((None, [], False))
+        return results
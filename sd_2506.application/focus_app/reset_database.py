@@ -3,8 +3,11 @@
 
 import sqlite3
 import os
+import shutil
 
 db_filename = "TEST.db"
+# フレームごとの記録（config.py の TIMESERIES_DIR）
+timeseries_dir = "timeseries"
 
 print("🔧 データベースリセットスクリプト")
 print("=" * 50)
@@ -22,6 +25,16 @@ if os.path.exists(db_filename):
 else:
     print(f"ℹ️  {db_filename} は存在しません（新規作成されます）")
 
+# WALモードの作業ファイルも削除（残っていると新しいファイルに適用されてしまう）
+for suffix in ("-wal", "-shm"):
+    if os.path.exists(db_filename + suffix):
+        os.remove(db_filename + suffix)
+
+# フレームごとの記録も削除（session_id が1から振り直されるので、古い記録に追記されないように）
+if os.path.isdir(timeseries_dir):
+    print(f"🗑️  {timeseries_dir}/ のフレームの記録を削除します...")
+    shutil.rmtree(timeseries_dir)
+
 # 新しいデータベースを作成
 print("\n📝 新しいテーブルを作成します...")
 
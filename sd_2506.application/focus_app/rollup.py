@@ -0,0 +1,88 @@
+# rollup.py
+# 場所: focus_app/rollup.py
+#
+# フレームごとの判定結果の集計（1分ごと・セッションごと）
+# フレームが届くたびにメモリ上の集計を更新し、write-behind バッファで
+# まとめてデータベースに書き込む。履歴やグラフはこの小さな集計済みの行を読むだけで、
+# フレームごとの記録（timeseries.py）を読み直さない
+
+import threading
+
+from .writebehind import WriteBehindBuffer
+
+
+class Aggregate:
+    """フレーム数・顔が写っていたフレーム数・スコアの合計/最小/最大"""
+    __slots__ = ('frames', 'face_frames', 'score_sum', 'score_min', 'score_max')
+
+    def __init__(self, frames=0, face_frames=0, score_sum=0.0, score_min=None, score_max=None):
+        self.frames = frames
+        self.face_frames = face_frames
+        self.score_sum = score_sum
+        self.score_min = score_min
+        self.score_max = score_max
+
+    def add(self, score, face):
+        self.frames += 1
+        self.face_frames += face
+        self.score_sum += score
+        self.score_min = score if self.score_min is None else min(self.score_min, score)
+        self.score_max = score if self.score_max is None else max(self.score_max, score)
+
+    def row(self):
+        return (self.frames, self.face_frames, self.score_sum, self.score_min, self.score_max)
+
+
+class SessionRollup:
+    __slots__ = ('minute', 'current', 'total')
+
+    def __init__(self, total):
+        self.minute = None
+        self.current = None
+        self.total = total
+
+
+class Rollups:
+    """
+    write_minutes(items): [((session_id, 分), 集計の行)] を書き込む
+    write_sessions(items): [(session_id, 集計の行)] を書き込む
+    load_session(session_id): 保存済みのセッションの集計の行（無ければ None）
+      再起動後も同じセッションの集計を0からやり直さないように、最初の1回だけ読む
+    """
+
+    def __init__(self, write_minutes, write_sessions, load_session, flush_interval=5.0):
+        self._minutes = WriteBehindBuffer(write_minutes, flush_interval)
+        self._sessions_buffer = WriteBehindBuffer(write_sessions, flush_interval)
+        self._load_session = load_session
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def add(self, session_id, t, score, face):
+        minute = int(t // 60)
+        with self._lock:
+            rollup = self._sessions.get(session_id)
+            if rollup is None:
+                saved = self._load_session(session_id)
+                rollup = self._sessions[session_id] = SessionRollup(Aggregate(*saved) if saved else Aggregate())
+            if rollup.minute != minute:
+                rollup.minute = minute
+                rollup.current = Aggregate()
+            rollup.current.add(score, face)
+            rollup.total.add(score, face)
+            # 途中の分もそのまま書き込むので、グラフは最新の分まで表示できる
+            self._minutes.put((session_id, minute), rollup.current.row())
+            self._sessions_buffer.put(session_id, rollup.total.row())
+
+    def flush(self):
+        self._minutes.flush()
+        self._sessions_buffer.flush()
+
+    # セッション終了時（集計を書き込んでメモリから消す）
+    def end(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        self.flush()
+
+    def close(self):
+        self._minutes.close()
+        self._sessions_buffer.close()
@@ -0,0 +1,192 @@
+# scheduler.py
+# 場所: focus_app/scheduler.py
+#
+# 推論の前に置くスケジューラ（最新のフレームを優先）
+# - 生徒ごとに待ち行列に入れるフレームは1枚だけ。推論を待っている間に次のフレームが届いたら
+#   古いフレームを新しいフレームで置き換え、両方のリクエストに新しいフレームの結果を返す
+#   （推論が追いつかなくなっても、古いフレームの判定を返し続けることがない）
+# - 待っている生徒のフレームをまとめて（マイクロバッチ）推論に渡す
+#   推論の完了は待たずに次のバッチを渡す（同時に推論中にできるバッチは max_in_flight まで）
+#   同じ生徒のフレームは前のフレームの推論が終わるまで渡さない（状態を古い結果で上書きしない）
+# - 待ち行列がいっぱいのときは新しい生徒のフレームを受け付けずに Overloaded を送出する
+#   （呼び出し側は 429 と Retry-After を返す）。待ち時間は待ち行列の長さで頭打ちになる
+
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, InvalidStateError
+
+from . import metrics
+
+
+class Overloaded(Exception):
+    """待ち行列がいっぱいで受け付けられない（retry_after 秒後に再送してほしい）"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"推論の待ち行列がいっぱいです（{retry_after}秒後に再送してください）")
+        self.retry_after = retry_after
+
+
+class _Pending:
+    __slots__ = ('payload', 'futures')
+
+    def __init__(self, payload, future):
+        self.payload = payload
+        self.futures = [future]
+
+
+# 待っている Future に結果（または例外）を渡す
+# 接続が切れて取り消された Future は飛ばす
+def _resolve(futures, value=None, error=None):
+    for future in futures:
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+        except InvalidStateError:
+            continue
+
+
+class FrameScheduler:
+    """
+    infer(items): [(キー, フレーム)] をまとめて推論に投入し、結果の列を返す Future を返す（待たない）
+                  推論できなかったフレームの結果は例外（そのフレームのリクエストだけに返す）
+    finish(key, payload, result): 推論結果を反映して、呼び出し側に返す値を作る
+    max_pending: 待ち行列に入れられる生徒の数
+    batch_size: 1回にまとめて推論する最大のフレーム数
+    max_in_flight: 同時に推論中にできるバッチの数（推論ワーカーの数に合わせる）
+    """
+
+    def __init__(self, infer, finish, max_pending=64, batch_size=8, max_in_flight=1):
+        self._infer = infer
+        self._finish = finish
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.max_in_flight = max(1, max_in_flight)
+        # 生徒 → 待っているフレーム（置き換えても並び順は最初に届いたときのまま）
+        self._pending = OrderedDict()
+        # 推論中の生徒と、推論中のバッチの数
+        self._running = set()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        # 1バッチあたりの処理時間の移動平均（Retry-After の見積もり用）
+        self._batch_seconds = 0.0
+
+    def submit(self, key, payload):
+        # フレームを待ち行列に入れて Future を返す（いっぱいなら Overloaded）
+        future = Future()
+        with self._cond:
+            if self._stop:
+                raise RuntimeError("スケジューラは停止しています")
+            pending = self._pending.get(key)
+            if pending is not None:
+                # 最新のフレームで置き換え、結果は待っている全員に返す
+                pending.payload = payload
+                pending.futures.append(future)
+                metrics.inc('scheduler_superseded')
+                return future
+            if len(self._pending) >= self.max_pending:
+                metrics.inc('scheduler_rejected')
+                raise Overloaded(self.retry_after())
+            self._pending[key] = _Pending(payload, future)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='frame-scheduler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    # 待ち行列が空くまでの見込み時間（秒、1以上の整数）
+    def retry_after(self):
+        batches = math.ceil(len(self._pending) / self.batch_size) + 1
+        return max(1, math.ceil(batches * self._batch_seconds / self.max_in_flight))
+
+    # 推論中でない生徒のフレームを、届いた順に batch_size まで取り出す（_cond を持って呼ぶ）
+    def _take_batch(self):
+        keys = []
+        for key in self._pending:
+            if key not in self._running:
+                keys.append(key)
+                if len(keys) >= self.batch_size:
+                    break
+        return [(key, self._pending.pop(key)) for key in keys]
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if self._stop:
+                    return None
+                if self._in_flight < self.max_in_flight:
+                    batch = self._take_batch()
+                    if batch:
+                        self._in_flight += 1
+                        self._running.update(key for key, _ in batch)
+                        return batch
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            start = time.perf_counter()
+            try:
+                future = self._infer([(key, pending.payload) for key, pending in batch])
+            except Exception as e:
+                self._complete(batch, start, error=e)
+                continue
+            future.add_done_callback(functools.partial(self._on_done, batch, start))
+
+    # 推論の Future が終わったとき（推論を実行したスレッドから呼ばれる）
+    def _on_done(self, batch, start, future):
+        if future.cancelled():
+            self._complete(batch, start, error=CancelledError())
+        elif future.exception() is not None:
+            self._complete(batch, start, error=future.exception())
+        else:
+            self._complete(batch, start, future.result())
+
+    # 推論結果を反映して待っているリクエストに返し、次のバッチを渡せるようにする
+    def _complete(self, batch, start, results=None, error=None):
+        try:
+            if error is not None:
+                for _, pending in batch:
+                    _resolve(pending.futures, error=error)
+            else:
+                for (key, pending), result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        _resolve(pending.futures, error=result)
+                        continue
+                    try:
+                        value = self._finish(key, pending.payload, result)
+                    except Exception as e:
+                        _resolve(pending.futures, error=e)
+                        continue
+                    _resolve(pending.futures, value)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._cond:
+                self._in_flight -= 1
+                self._running.difference_update(key for key, _ in batch)
+                if error is None:
+                    self._batch_seconds = elapsed if not self._batch_seconds \
+                        else 0.8 * self._batch_seconds + 0.2 * elapsed
+                self._cond.notify()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def close(self):
+        # 停止して、待っているフレームのリクエストは取り消す
+        with self._cond:
+            self._stop = True
+            pending, self._pending = self._pending, OrderedDict()
+            self._cond.notify_all()
+        for entry in pending.values():
+            for future in entry.futures:
+                future.cancel()
@@ -0,0 +1,96 @@
+# scoring.py
+# 場所: focus_app/scoring.py
+#
+# FaceMeshの特徴点からの特徴量計算（ベクトル化版）
+# 特徴点は (478, 3) の配列で扱い、(n_frames, 478, 3) のバッチもそのまま渡せる
+
+from itertools import chain
+
+import numpy as np
+
+# FaceMeshの特徴点数（refine_landmarks=True で虹彩10点を含む。False のときは468点）
+NUM_LANDMARKS = 478
+
+# EAR計算に使う目の特徴点（p1, p2, p3, p4, p5, p6 の順）
+LEFT_EYE_IDS = [33, 160, 158, 133, 153, 144]
+RIGHT_EYE_IDS = [362, 385, 387, 263, 373, 380]
+EYE_INDEX = np.array([LEFT_EYE_IDS, RIGHT_EYE_IDS])
+
+# 顔の向き（左右）の推定に使う特徴点
+NOSE_TIP_ID = 1
+LEFT_EYE_OUTER_ID = 33
+RIGHT_EYE_OUTER_ID = 263
+
+# 1フレームの特徴量の計算に使う特徴点（目12点 + 鼻先。目尻は目の点に含まれる）
+FEATURE_IDS = EYE_INDEX.ravel().tolist() + [NOSE_TIP_ID]
+
+# 特徴量の計算に虹彩の特徴点（468〜477）を使うか
+# EAR・顔の向きは顔の輪郭の特徴点（0〜467）だけで求まるので、FaceMeshの虹彩の精密化は不要
+USES_IRIS = False
+
+# EARの縦方向2本・横方向1本の組 (p2-p6, p3-p5, p1-p4)
+_EAR_FROM = [1, 2, 0]
+_EAR_TO = [5, 4, 3]
+
+
+# FaceMeshの結果（NormalizedLandmarkList か landmark の列）→ (N, 3) 配列
+def landmarks_to_array(face_landmarks, dtype=np.float32):
+    landmarks = getattr(face_landmarks, 'landmark', face_landmarks)
+    n = len(landmarks)
+    flat = np.fromiter(chain.from_iterable((lm.x, lm.y, lm.z) for lm in landmarks),
+                       dtype=dtype, count=n * 3)
+    return flat.reshape(n, 3)
+
+
+# 1フレーム分のFaceMeshの結果 → (N, 3) 配列（ids の特徴点だけを取り出し、それ以外は NaN）
+# 478点すべてを取り出すより速い。compute_features にそのまま渡せる
+def landmarks_to_points(face_landmarks, ids=FEATURE_IDS, dtype=np.float32):
+    landmarks = getattr(face_landmarks, 'landmark', face_landmarks)
+    points = np.full((len(landmarks), 3), np.nan, dtype=dtype)
+    for i in ids:
+        lm = landmarks[i]
+        points[i] = (lm.x, lm.y, lm.z)
+    return points
+
+
+# 目の特徴点 (..., 6, 2) → EAR (...)
+def ear_from_eye_points(eyes):
+    eyes = np.asarray(eyes, dtype=np.float64)
+    diffs = eyes[..., _EAR_FROM, :] - eyes[..., _EAR_TO, :]
+    lengths = np.sqrt(np.einsum('...ij,...ij->...i', diffs, diffs))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (lengths[..., 0] + lengths[..., 1]) / (2.0 * lengths[..., 2])
+
+
+# 特徴点 (..., 478, 2+) → 左右のEAR (..., 2)
+def eye_aspect_ratios(points):
+    points = np.asarray(points)
+    return ear_from_eye_points(points[..., EYE_INDEX, :2])
+
+
+# 特徴点 (..., 478, 2+) → 特徴量をまとめて計算
+def compute_features(points):
+    """
+    points: (478, 3) または (n_frames, 478, 3)
+    戻り値: dict
+        ear_left, ear_right: 左右それぞれのEAR
+        ear: 左右の平均EAR
+        yaw: 顔の左右の向き（鼻先が両目尻の中点からどれだけずれているか、目尻間の距離で正規化）
+    """
+    points = np.asarray(points)
+    ears = eye_aspect_ratios(points)
+
+    xy = points[..., :2]
+    left_outer = xy[..., LEFT_EYE_OUTER_ID, :]
+    right_outer = xy[..., RIGHT_EYE_OUTER_ID, :]
+    eye_width = np.linalg.norm(right_outer - left_outer, axis=-1)
+    center_x = (left_outer[..., 0] + right_outer[..., 0]) / 2.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        yaw = (xy[..., NOSE_TIP_ID, 0] - center_x) / eye_width
+
+    return {
+        'ear_left': ears[..., 0],
+        'ear_right': ears[..., 1],
+        'ear': ears.mean(axis=-1),
+        'yaw': yaw,
+    }
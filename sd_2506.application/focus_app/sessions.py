@@ -0,0 +1,119 @@
+# sessions.py
+# 場所: focus_app/sessions.py
+#
+# 学習中（セッション中）の生徒とそのカウンタをメモリ上に持つレジストリ
+# 先生用ダッシュボードの一覧はここから作るので、問い合わせのたびに
+# 生徒ごとのSQLiteファイルを開かない（SQLiteは記録の保存だけに使う）
+# 集中時間・非集中時間もフレームの判定結果からサーバー側で数える
+
+import bisect
+import threading
+
+
+class LiveSession:
+    """セッション中の生徒1人分"""
+    __slots__ = ('user_id', 'username', 'session_id', 'teacher_name', 'start_time',
+                 'focus_seconds', 'unfocus_seconds', 'focused', 'last_verdict_at')
+
+    def __init__(self, user_id, username, session_id, teacher_name, start_time,
+                 focus_seconds=0, unfocus_seconds=0):
+        self.user_id = user_id
+        self.username = username
+        self.session_id = session_id
+        self.teacher_name = teacher_name
+        self.start_time = start_time
+        self.focus_seconds = focus_seconds
+        self.unfocus_seconds = unfocus_seconds
+        # 直近の判定（まだ判定なし: None）とその時刻（time.monotonic()）
+        self.focused = None
+        self.last_verdict_at = None
+
+
+class SessionRegistry:
+    """
+    生徒の名簿とセッション中の生徒
+    初回アクセス時に一度だけSQLiteから読み込み、以降は新規登録・セッション開始/終了・
+    フレームの判定結果でメモリ上の内容を更新する
+    """
+
+    def __init__(self, max_gap=10.0):
+        # 判定の間隔がこれより空いた場合（カメラ停止・通信断など）は max_gap 秒までしか数えない
+        self.max_gap = max_gap
+        self._lock = threading.Lock()
+        self._loaded = False
+        # 名簿（名前順）と user_id → 名前
+        self._roster = []
+        self._names = {}
+        self._sessions = {}
+
+    def ensure_loaded(self, load_students, load_active_sessions):
+        # load_students() → [(user_id, 名前)]
+        # load_active_sessions() → 再起動前から続いているセッション（dict）の一覧
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for user_id, username in load_students():
+                self._add_student(user_id, username)
+            for active in load_active_sessions():
+                user_id = active['user_id']
+                if user_id in self._names and user_id not in self._sessions:
+                    self._sessions[user_id] = LiveSession(
+                        user_id, self._names[user_id], active['session_id'], active['teacher_name'],
+                        active['start_time'], active['focus_seconds'], active['unfocus_seconds'])
+            self._loaded = True
+
+    def _add_student(self, user_id, username):
+        if user_id in self._names:
+            return
+        self._names[user_id] = username
+        bisect.insort(self._roster, (username, user_id))
+
+    def add_student(self, user_id, username):
+        with self._lock:
+            self._add_student(user_id, username)
+
+    def start(self, user_id, username, session_id, teacher_name, start_time):
+        live = LiveSession(user_id, username, session_id, teacher_name, start_time)
+        with self._lock:
+            self._add_student(user_id, username)
+            self._sessions[user_id] = live
+        return live
+
+    # フレームの判定結果を反映
+    # 前回の判定から now までの時間を前回の判定（集中/非集中）の時間として加算し、
+    # (session_id, 集中秒, 非集中秒) を返す（セッション中でなければ None）
+    def observe(self, user_id, focused, now):
+        with self._lock:
+            live = self._sessions.get(user_id)
+            if live is None:
+                return None
+            if live.last_verdict_at is not None and live.focused is not None:
+                elapsed = min(max(now - live.last_verdict_at, 0.0), self.max_gap)
+                if live.focused:
+                    live.focus_seconds += elapsed
+                else:
+                    live.unfocus_seconds += elapsed
+            live.last_verdict_at = now
+            live.focused = focused
+            return live.session_id, live.focus_seconds, live.unfocus_seconds
+
+    def end(self, user_id):
+        with self._lock:
+            return self._sessions.pop(user_id, None)
+
+    def get(self, user_id):
+        return self._sessions.get(user_id)
+
+    def name(self, user_id):
+        return self._names.get(user_id)
+
+    # [(user_id, 名前, LiveSession または None)]（名前順）
+    def students(self):
+        with self._lock:
+            return [(user_id, username, self._sessions.get(user_id))
+                    for username, user_id in self._roster]
+
+    def __len__(self):
+        return len(self._sessions)
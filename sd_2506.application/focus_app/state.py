@@ -0,0 +1,92 @@
+# state.py
+# 場所: focus_app/state.py
+#
+# 生徒ごとの集中度判定の状態（目を閉じ始めた時刻・顔が消えた時刻・直近スコア）
+# 全生徒で共有していたグローバル変数の代わりに、キーごとの小さなレコードで持つ
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class FocusState:
+    """生徒1人分の判定状態"""
+    __slots__ = ('score', 'focused', 'alerted', 'minutes', 'interval', 'stable',
+                 'eye_closed_start_time', 'face_missing_start_time', 'last_seen')
+
+    def __init__(self):
+        self.score = 100
+        # 直近の判定（集中: True / 非集中: False / まだ判定なし: None）
+        self.focused = None
+        # 先生用ダッシュボードでアラート表示中か
+        self.alerted = False
+        # 先生用ダッシュボードに送った集中時間・非集中時間（分）
+        self.minutes = None
+        # 直近に返した次のキャプチャまでの間隔（ミリ秒）
+        self.interval = 0
+        # 集中していてスコアが変わらない推論結果が続いた回数
+        self.stable = 0
+        self.eye_closed_start_time = None
+        self.face_missing_start_time = None
+        self.last_seen = time.monotonic()
+
+
+class StateStore:
+    """
+    キー（生徒）ごとの FocusState を持つストア
+    キーのハッシュでシャードに分け、ロックはシャード単位なので
+    別の生徒のリクエストは並行に処理できる
+    idle_timeout 秒アクセスの無いレコードは定期的に削除する
+    """
+
+    def __init__(self, shards=16, idle_timeout=600, sweep_interval=60):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    @contextmanager
+    def locked(self, key):
+        # キーの状態をシャードのロックを持ったまま取り出す（無ければ作成）
+        now = time.monotonic()
+        if now - self._last_sweep > self.sweep_interval:
+            self._last_sweep = now
+            self.evict_idle(now)
+
+        records, lock = self._shard(key)
+        with lock:
+            state = records.get(key)
+            if state is None:
+                state = records[key] = FocusState()
+            state.last_seen = now
+            yield state
+
+    def get(self, key):
+        # 読み取り用（無ければ None）
+        records, lock = self._shard(key)
+        with lock:
+            return records.get(key)
+
+    def discard(self, key):
+        records, lock = self._shard(key)
+        with lock:
+            records.pop(key, None)
+
+    def evict_idle(self, now=None):
+        # 一定時間アクセスの無いレコードを削除
+        now = now if now is not None else time.monotonic()
+        deadline = now - self.idle_timeout
+        evicted = 0
+        for records, lock in self._shards:
+            with lock:
+                stale = [key for key, state in records.items() if state.last_seen < deadline]
+                for key in stale:
+                    del records[key]
+                evicted += len(stale)
+        return evicted
+
+    def __len__(self):
+        return sum(len(records) for records, _ in self._shards)
@@ -69,8 +69,7 @@ function startCamera() {
             hideCameraOverlay();
             
             // 分析開始
-            if (analysisInterval) clearInterval(analysisInterval);
-            analysisInterval = setInterval(captureAndSend, 3000);
+            startAnalysis();
             console.log('分析を開始しました');
         })
         .catch(err => {
@@ -99,11 +98,8 @@ function stopCamera() {
         showCameraOffOverlay();
         
         // 分析停止
-        if (analysisInterval) {
-            clearInterval(analysisInterval);
-            analysisInterval = null;
-            console.log('分析を停止しました');
-        }
+        stopAnalysis();
+        console.log('分析を停止しました');
         
         // ステータスをリセット
         resetFocusStatus();
@@ -293,6 +289,14 @@ function setupEventListeners() {
     if (bgmSelect) bgmSelect.onchange = bgmControl;
     if (testBgmBtn) testBgmBtn.onclick = playBGM;
 
+    // 顔解析設定（切り替えたら送信方法を選び直す）
+    const clientMeshCheckbox = document.getElementById('enable-client-mesh');
+    if (clientMeshCheckbox) {
+        clientMeshCheckbox.onchange = () => {
+            if (cameraOn) startAnalysis();
+        };
+    }
+
     // 神経衰弱ゲーム
     const gameBtn = document.getElementById('btn-game');
     const manualGameBtn = document.getElementById('manual-game');
@@ -465,19 +469,163 @@ function updateGrowthProgress() {
     }
 }
 
-// 画像キャプチャ→分析
+// 分析の開始・停止
+// WebSocketが使える場合は接続を張ったままフレームを送り、判定結果を受け取る
+// 使えない場合（Flaskの開発サーバーなど）はHTTPで送信する
+// 次のキャプチャまでの間隔はサーバーが判定結果と一緒に返す（next_interval_ms）
+const HTTP_FRAME_INTERVAL = 3000;
+const WS_FRAME_INTERVAL = 1000;
+let nextCaptureDelay = HTTP_FRAME_INTERVAL;
+let frameSocket = null;
+let frameSocketUnavailable = false;
+let socketCaptureTimer = null;
+
+function startAnalysis() {
+    stopAnalysis();
+    if (!frameSocketUnavailable && !isClientMeshEnabled() && 'WebSocket' in window) {
+        openFrameSocket();
+    } else {
+        nextCaptureDelay = HTTP_FRAME_INTERVAL;
+        scheduleHttpCapture(nextCaptureDelay);
+    }
+}
+
+// HTTP送信：応答を受け取ってから、サーバーが返した間隔で次のキャプチャを予約
+// （429 のときも応答の next_interval_ms をあけて再送する）
+function scheduleHttpCapture(delay) {
+    const timer = setTimeout(() => {
+        captureAndSend().finally(() => {
+            // 応答を待っている間に停止・再開された場合は予約しない
+            if (analysisInterval === timer) scheduleHttpCapture(nextCaptureDelay);
+        });
+    }, delay);
+    analysisInterval = timer;
+}
+
+function stopAnalysis() {
+    if (analysisInterval) {
+        clearTimeout(analysisInterval);
+        analysisInterval = null;
+    }
+    if (socketCaptureTimer) {
+        clearTimeout(socketCaptureTimer);
+        socketCaptureTimer = null;
+    }
+    if (frameSocket) {
+        const socket = frameSocket;
+        frameSocket = null;
+        socket.close();
+    }
+}
+
+function openFrameSocket() {
+    const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${scheme}://${location.host}/ws/frames`);
+    socket.binaryType = 'arraybuffer';
+    frameSocket = socket;
+    let opened = false;
+
+    socket.onopen = () => {
+        opened = true;
+        console.log('WebSocketで分析を開始しました');
+        scheduleSocketCapture(0);
+    };
+
+    socket.onmessage = event => {
+        const data = JSON.parse(event.data);
+        handleAnalysisResult(data);
+        // 結果を受け取ってから次のフレームを送る（送りすぎない）
+        scheduleSocketCapture(data.next_interval_ms || WS_FRAME_INTERVAL);
+    };
+
+    socket.onclose = event => {
+        // stopAnalysis() で閉じた場合は何もしない
+        if (frameSocket !== socket) return;
+        frameSocket = null;
+        if (socketCaptureTimer) {
+            clearTimeout(socketCaptureTimer);
+            socketCaptureTimer = null;
+        }
+        if (event.code === 4401) {
+            handleAnalysisResult({ error: '未ログインまたは権限がありません' });
+            return;
+        }
+        if (!cameraOn) return;
+
+        if (!opened) {
+            // 接続できない → HTTP送信に切り替え
+            console.log('WebSocketが使えないためHTTP送信に切り替えます');
+            frameSocketUnavailable = true;
+            startAnalysis();
+        } else {
+            // 切断された → 少し待って再接続
+            setTimeout(() => {
+                if (cameraOn && !frameSocket && !analysisInterval) startAnalysis();
+            }, 2000);
+        }
+    };
+}
+
+function scheduleSocketCapture(delay) {
+    if (socketCaptureTimer) clearTimeout(socketCaptureTimer);
+    socketCaptureTimer = setTimeout(() => {
+        socketCaptureTimer = null;
+        const socket = frameSocket;
+        if (!socket || socket.readyState !== WebSocket.OPEN) return;
+
+        const captured = captureFrame(blob => {
+            if (!blob) {
+                scheduleSocketCapture(WS_FRAME_INTERVAL);
+            } else if (frameSocket === socket && socket.readyState === WebSocket.OPEN) {
+                socket.send(blob);
+            }
+        });
+        // カメラの準備ができていなければ少し待って再試行
+        if (!captured) scheduleSocketCapture(WS_FRAME_INTERVAL);
+    }, delay);
+}
+
+// 画像キャプチャ→分析（応答を処理し終えたら解決する Promise を返す）
 function captureAndSend() {
+    // ブラウザ側で顔解析するモード：特徴点だけを送る
+    if (isClientMeshEnabled()) {
+        const video = getReadyVideo();
+        return video ? sendLandmarks(video) : Promise.resolve();
+    }
+
+    return new Promise(resolve => {
+        const captured = captureFrame(blob => {
+            if (blob) {
+                sendFrame(blob).finally(resolve);
+            } else {
+                resolve();
+            }
+        });
+        if (!captured) resolve();
+    });
+}
+
+// 分析できる状態のvideo要素（カメラOFF・準備中は null）
+function getReadyVideo() {
     // カメラがOFFの場合は何もしない
     if (!cameraOn) {
         console.log('カメラがOFFのため分析をスキップします');
-        return;
+        return null;
     }
     
     const video = document.getElementById('camera');
     if (!video || !video.videoWidth || video.videoWidth === 0) {
         console.log('Video not ready yet');
-        return;
+        return null;
     }
+    return video;
+}
+
+// 現在のフレームをJPEGのBlobにして callback に渡す（キャプチャできなければ false）
+// エンコードに失敗したときは callback に null を渡す
+function captureFrame(callback) {
+    const video = getReadyVideo();
+    if (!video) return false;
     
     console.log('キャプチャ実行中');
     
@@ -498,19 +646,105 @@ function captureAndSend() {
     const ctx = canvas.getContext('2d');
     ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
     
-    // Base64エンコード
-    const imageData = canvas.toDataURL('image/jpeg', 0.8);
-    
+    // JPEGのBlobにしてそのまま送信（Base64/JSONを経由しない）
+    canvas.toBlob(blob => {
+        if (!blob) {
+            console.error('フレームのエンコードに失敗しました');
+        }
+        callback(blob);
+    }, 'image/jpeg', 0.8);
+    return true;
+}
+
+function sendFrame(blob) {
     // Flaskバックエンドに送信
-    fetch('/index_coolver', {
+    return handleAnalysisResponse(fetch('/api/frame', {
         method: 'POST',
         headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'image/jpeg'
         },
-        body: JSON.stringify({
-            image: imageData
+        body: blob
+    }));
+}
+
+// ブラウザ側 Face Mesh（特徴点のみ送信モード）
+// バージョンを固定（モデルファイルも同じバージョンから読み込む）
+const FACE_MESH_CDN = 'https://cdn.jsdelivr.net/npm/@mediapipe/face_mesh@0.4.1633559619/';
+let clientFaceMesh = null;
+let clientFaceMeshLoading = null;
+let clientFaceMeshBusy = false;
+// onClientFaceMeshResults で送った特徴点のリクエスト
+let landmarksRequest = null;
+
+function isClientMeshEnabled() {
+    const toggle = document.getElementById('enable-client-mesh');
+    return toggle ? toggle.checked : CLIENT_LANDMARKS;
+}
+
+function loadClientFaceMesh() {
+    if (clientFaceMesh) return Promise.resolve(clientFaceMesh);
+    if (clientFaceMeshLoading) return clientFaceMeshLoading;
+
+    clientFaceMeshLoading = new Promise((resolve, reject) => {
+        const script = document.createElement('script');
+        script.src = FACE_MESH_CDN + 'face_mesh.js';
+        script.crossOrigin = 'anonymous';
+        script.onload = () => {
+            const faceMesh = new FaceMesh({ locateFile: file => FACE_MESH_CDN + file });
+            faceMesh.setOptions({
+                maxNumFaces: 1,
+                refineLandmarks: false,
+                minDetectionConfidence: 0.5,
+                minTrackingConfidence: 0.5
+            });
+            faceMesh.onResults(onClientFaceMeshResults);
+            clientFaceMesh = faceMesh;
+            resolve(faceMesh);
+        };
+        script.onerror = () => {
+            clientFaceMeshLoading = null;
+            reject(new Error('Face Meshの読み込みに失敗しました'));
+        };
+        document.head.appendChild(script);
+    });
+    return clientFaceMeshLoading;
+}
+
+function sendLandmarks(video) {
+    // 前のフレームの解析中は送らない
+    if (clientFaceMeshBusy) return Promise.resolve();
+    clientFaceMeshBusy = true;
+    landmarksRequest = null;
+
+    return loadClientFaceMesh()
+        .then(faceMesh => faceMesh.send({ image: video }))
+        // 解析結果（onResults）で送った特徴点の応答を待つ
+        .then(() => landmarksRequest)
+        .catch(error => {
+            console.error('ブラウザ解析エラー:', error);
         })
-    })
+        .finally(() => {
+            clientFaceMeshBusy = false;
+        });
+}
+
+function onClientFaceMeshResults(results) {
+    const landmarks = results.multiFaceLandmarks && results.multiFaceLandmarks[0];
+    // EAR計算に必要な目の特徴点だけを送る（顔なしは null）
+    const eye = landmarks ? EYE_IDS.map(i => [landmarks[i].x, landmarks[i].y]) : null;
+
+    landmarksRequest = handleAnalysisResponse(fetch('/api/landmarks', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ eye: eye })
+    }));
+}
+
+// 分析APIのレスポンス処理（処理し終えたら解決する Promise を返す）
+function handleAnalysisResponse(request) {
+    return request
     .then(response => {
         // レスポンスのContent-Typeを確認
         const contentType = response.headers.get('content-type');
@@ -520,34 +754,15 @@ function captureAndSend() {
             throw new Error('サーバーエラー: JSON形式ではありません');
         }
         
-        // // ステータスコード確認
-        if (!response.ok) {
+        // // ステータスコード確認（401 はエラー内容を見てログインページへ）
+        // 429（混み合っている）は next_interval_ms の間隔をあけて再送する
+        if (!response.ok && response.status !== 401 && response.status !== 429) {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
         }
         
         return response.json();
     })
-    .then(data => {
-        console.log('分析結果:', data);
-        
-        // エラーチェック
-        if (data.error) {
-            console.error('サーバーエラー:', data.error);
-            
-            // セッション切れの場合はログインページへ
-            if (data.error.includes('未ログイン') || data.error.includes('権限')) {
-                alert('セッションが切れました。再度ログインしてください。');
-                window.location.href = '/';
-                return;
-            }
-            return;
-        }
-        
-        // 結果に基づいてUI更新
-        if (data.focus) {
-            updateFocusStatus({ focus: data.focus });
-        }
-    })
+    .then(handleAnalysisResult)
     .catch(error => {
         console.error('分析エラー:', error);
         
@@ -558,6 +773,34 @@ function captureAndSend() {
     });
 }
 
+// 分析結果の処理（HTTP・WebSocket共通）
+function handleAnalysisResult(data) {
+    console.log('分析結果:', data);
+    
+    // サーバーが推奨する次のキャプチャまでの間隔
+    if (data.next_interval_ms) {
+        nextCaptureDelay = data.next_interval_ms;
+    }
+    
+    // エラーチェック
+    if (data.error) {
+        console.error('サーバーエラー:', data.error);
+        
+        // セッション切れの場合はログインページへ
+        if (data.error.includes('未ログイン') || data.error.includes('権限')) {
+            alert('セッションが切れました。再度ログインしてください。');
+            window.location.href = '/';
+            return;
+        }
+        return;
+    }
+    
+    // 結果に基づいてUI更新
+    if (data.focus) {
+        updateFocusStatus({ focus: data.focus });
+    }
+}
+
 
 // 集中状態更新
 
@@ -1214,7 +1457,7 @@ function loadSettingsUI() {
 
 // クリーンアップ
 window.addEventListener('beforeunload', function() {
-    if (analysisInterval) clearInterval(analysisInterval);
+    stopAnalysis();
     if (timerInterval) clearInterval(timerInterval);
     if (breakTimerInterval) clearInterval(breakTimerInterval);
     
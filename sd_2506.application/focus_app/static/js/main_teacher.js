@@ -3,26 +3,29 @@ let students = [];
 let selectedStudent = null;
 let notificationCount = 0;
 let updateInterval = null;
+let studentEvents = null;
 
 // 初期化
 
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Teacher Dashboard loaded');
     
-    // 生徒データ取得
-    // fetchStudentsData();
-    // ダミーデータ生成
-    generateDummyStudents();
-    
     // 初期表示
     renderStudentsList();
     updateStatistics();
     
+    // 生徒データ取得（取得できなければダミーデータ）
+    fetchStudentsData();
+    
     // イベントリスナー設定
     setupEventListeners();
     
-    // 定期更新開始（5秒ごと）
-    startAutoUpdate();
+    // 変更のプッシュ受信（未対応のブラウザは5秒ごとの定期更新）
+    if (window.EventSource) {
+        startLiveUpdates();
+    } else {
+        startAutoUpdate();
+    }
 });
 
 
@@ -134,29 +137,102 @@ function generateDummyStudents() {
 // }
 
 
-// 生徒データ取得（ダミーデータ使用版）
+// 生徒データ取得（APIに接続できない場合はダミーデータ）
 function fetchStudentsData() {
-    // ダミーデータを使用する場合は何もしない
-    // 実際のAPIを使用する場合は以下をコメント解除
-    /*
     fetch('/api/teacher/students')
         .then(res => res.json())
         .then(data => {
             if (data.success) {
                 students = data.students;
-                renderStudentsList();
-                updateStatistics();
-                if (selectedStudent) {
-                    const updated = students.find(s => s.id === selectedStudent.id);
-                    if (updated) selectStudent(updated);
-                }
+                refreshStudents();
             } else {
                 console.error('生徒データ取得エラー:', data.error);
             }
         })
-        .catch(err => console.error('APIエラー:', err));
-    */
-    console.log('ダミーデータを使用中');
+        .catch(err => {
+            console.error('APIエラー:', err);
+            if (students.length === 0) {
+                console.log('ダミーデータを使用中');
+                generateDummyStudents();
+                refreshStudents();
+            }
+        });
+}
+
+
+// 一覧・統計・選択中の生徒の詳細を描き直す
+function refreshStudents(changedId) {
+    renderStudentsList();
+    updateStatistics();
+    if (selectedStudent && (changedId === undefined || changedId === selectedStudent.id)) {
+        const updated = students.find(s => s.id === selectedStudent.id);
+        if (updated) selectStudent(updated);
+    }
+}
+
+
+// サーバーからの変更通知（Server-Sent Events）
+// 一覧全体を取り直さず、変わった生徒だけを書き換える
+function startLiveUpdates() {
+    studentEvents = new EventSource('/api/teacher/events');
+    
+    // セッション開始・終了: 生徒の行を丸ごと置き換え（いなければ追加）
+    const upsert = event => {
+        const entry = JSON.parse(event.data);
+        const index = students.findIndex(s => s.id === entry.id);
+        if (index >= 0) {
+            students[index] = Object.assign({}, students[index], entry);
+        } else {
+            students.push(entry);
+        }
+        refreshStudents(entry.id);
+    };
+    studentEvents.addEventListener('session_start', upsert);
+    studentEvents.addEventListener('session_end', upsert);
+    
+    // 集中/非集中の切り替わり
+    studentEvents.addEventListener('focus', event => {
+        const data = JSON.parse(event.data);
+        const student = students.find(s => s.id === data.id);
+        if (!student) return;
+        student.focus = data.focus;
+        refreshStudents(data.id);
+    });
+    
+    // 集中時間・非集中時間（サーバー側で数えた値。分単位で変わったとき）
+    studentEvents.addEventListener('minutes', event => {
+        const data = JSON.parse(event.data);
+        const student = students.find(s => s.id === data.id);
+        if (!student) return;
+        student.focusMinutes = data.focusMinutes;
+        student.unfocusMinutes = data.unfocusMinutes;
+        student.unfocusRate = data.unfocusRate;
+        refreshStudents(data.id);
+    });
+    
+    // アラートの発生・解除
+    studentEvents.addEventListener('alert', event => {
+        const data = JSON.parse(event.data);
+        const student = students.find(s => s.id === data.id);
+        if (!student) return;
+        const wasAlert = student.needsAlert;
+        student.needsAlert = data.needsAlert;
+        student.unfocusRate = data.unfocusRate;
+        if (!wasAlert && student.needsAlert) {
+            showToast(`${student.name}さんの集中度が低下しています`);
+        }
+        refreshStudents(data.id);
+    });
+    
+    // 取りこぼしがあった場合は一覧を取り直す
+    studentEvents.addEventListener('resync', fetchStudentsData);
+    
+    // 再接続時（切断中の変更を取りこぼしている可能性がある）も取り直す
+    let connectedOnce = false;
+    studentEvents.onopen = function() {
+        if (connectedOnce) fetchStudentsData();
+        connectedOnce = true;
+    };
 }
 
 
@@ -202,6 +278,7 @@ function createStudentCard(student) {
             <div class="student-status ${student.isOnline?'status-online':'status-offline'}">
                 <span class="material-icons">${student.isOnline?'check_circle':'radio_button_unchecked'}</span>
                 <span>${student.isOnline?'オンライン':'オフライン'}</span>
+                ${student.isOnline && student.focus === 'unfocused' ? '<span>（非集中）</span>' : ''}
             </div>
             <div class="student-time-info">
                 <div class="time-badge focus"><span class="material-icons">check</span><span>${student.focusMinutes}分</span></div>
@@ -218,16 +295,13 @@ function createStudentCard(student) {
 
 // 選択した生徒の履歴情報（ダミーデータ使用版）
 function fetchStudentHistory(studentId) {
-    // ダミーデータから履歴を取得
+    // ダミーデータは生徒データに履歴を持っている
     const student = students.find(s => s.id === studentId);
     if (student && student.history) {
         renderStudentHistory(student.history);
-    } else {
-        renderStudentHistory([]);
+        return;
     }
     
-    // 実際のAPIを使用する場合は以下をコメント解除
-    /*
     fetch(`/api/teacher/student-history/${studentId}`)
         .then(res => res.json())
         .then(data => {
@@ -242,7 +316,6 @@ function fetchStudentHistory(studentId) {
             console.error('APIエラー:', err);
             renderStudentHistory([]);
         });
-    */
 }
 
 // 統計更新
@@ -397,6 +470,7 @@ function renderStudentHistory(history) {
                 <div class="history-stats">
                     <div>集中: <strong>${focusMin}分</strong></div>
                     <div>非集中: <strong>${unfocusMin}分</strong></div>
+                    ${session.avg_score != null ? `<div>平均スコア: <strong>${session.avg_score}</strong></div>` : ''}
                 </div>
             </div>
         `;
@@ -557,6 +631,9 @@ window.addEventListener('beforeunload', function() {
     if (updateInterval) {
         clearInterval(updateInterval);
     }
+    if (studentEvents) {
+        studentEvents.close();
+    }
 });
 
 console.log('Teacher Dashboard JavaScript loaded successfully');
@@ -0,0 +1,95 @@
+# timeseries.py
+# 場所: focus_app/timeseries.py
+#
+# フレームごとの判定結果（時刻・スコア・EAR・顔の有無）の保存
+# セッションごとに固定長レコードのバイナリファイル（<session_id>.bin）へ追記するだけなので、
+# 読むときは np.memmap でコピーせずにNumPyの構造化配列として扱える
+#
+# 解析の処理は append() でメモリ上のリストに追加するだけで、
+# ファイルへの書き込みはバックグラウンドのスレッドがまとめて行う
+
+import os
+import threading
+
+import numpy as np
+
+# 1フレーム分のレコード（17バイト）
+# t: UNIX時刻（秒） / score: 集中度スコア / ear: EAR（顔なしは NaN） / face: 顔があれば 1
+RECORD_DTYPE = np.dtype([('t', '<f8'), ('score', '<f4'), ('ear', '<f4'), ('face', 'u1')])
+
+
+class TimeSeriesStore:
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        # session_id → まだ書き込んでいないレコード [(t, score, ear, face)]
+        self._pending = {}
+        self._lock = threading.Lock()
+        # 同じファイルへの書き込みが前後しないように
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def path(self, session_id):
+        return os.path.join(self.directory, f'{session_id}.bin')
+
+    def append(self, session_id, t, score, ear):
+        record = (t, score, np.nan if ear is None else ear, ear is not None)
+        with self._lock:
+            records = self._pending.get(session_id)
+            if records is None:
+                records = self._pending[session_id] = []
+            records.append(record)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='timeseries', daemon=True)
+                self._thread.start()
+
+    # 新しいセッションの記録を始める（データベースを作り直すと session_id が1から振り直されるので、
+    # 同じ番号の古いファイルが残っていれば消す）
+    def start(self, session_id):
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(session_id, None)
+            try:
+                os.remove(self.path(session_id))
+            except FileNotFoundError:
+                pass
+
+    # 溜まっているレコードをファイルに追記（session_id を指定するとそのセッションだけ）
+    def flush(self, session_id=None):
+        with self._write_lock:
+            with self._lock:
+                if session_id is None:
+                    pending, self._pending = self._pending, {}
+                else:
+                    records = self._pending.pop(session_id, None)
+                    pending = {session_id: records} if records else {}
+            if not pending:
+                return 0
+            os.makedirs(self.directory, exist_ok=True)
+            written = 0
+            for key, records in pending.items():
+                with open(self.path(key), 'ab') as f:
+                    f.write(np.array(records, dtype=RECORD_DTYPE).tobytes())
+                written += len(records)
+            return written
+
+    # セッションのレコード（構造化配列。ファイルをそのままメモリマップするので読み取り専用）
+    def read(self, session_id):
+        self.flush(session_id)
+        path = self.path(session_id)
+        if not os.path.exists(path) or os.path.getsize(path) < RECORD_DTYPE.itemsize:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                         shape=(os.path.getsize(path) // RECORD_DTYPE.itemsize,))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print("フレームの記録の保存中にエラーが発生しました:", e)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
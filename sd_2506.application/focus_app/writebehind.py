@@ -0,0 +1,66 @@
+# writebehind.py
+# 場所: focus_app/writebehind.py
+#
+# 書き込みの後回し（write-behind）バッファ
+# 同じキーへの更新はメモリ上で最新の値にまとめ、一定間隔で1つのトランザクションに
+# まとめて書き込む。生徒が頻繁に集中時間を報告しても、コミット（fsync）は
+# 間隔ごとに1回で済み、SQLiteの書き込みロックの取り合いも起きにくい
+
+import threading
+
+
+class WriteBehindBuffer:
+    """
+    write(items): [(キー, 値)] をまとめて書き込む関数（1トランザクションで）
+    interval: 自動で書き込む間隔（秒）
+    """
+
+    def __init__(self, write, interval=5.0):
+        self._write = write
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        # 書き込み中の flush が終わるまで次の flush を待たせる
+        # （セッション終了時の flush が古い値の書き込みに追い越されないように）
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def put(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    # 溜まっている更新を書き込む（書き込んだ件数を返す）
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                items, self._pending = list(self._pending.items()), {}
+            if not items:
+                return 0
+            try:
+                self._write(items)
+            except Exception:
+                # 失敗したら戻す（その間に入った新しい値を優先）
+                with self._lock:
+                    for key, value in items:
+                        self._pending.setdefault(key, value)
+                raise
+            return len(items)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print("書き込みバッファの保存中にエラーが発生しました:", e)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
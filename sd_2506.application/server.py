@@ -1,4 +1,5 @@
-from focus_app import app
+# ルートを登録した Flask アプリ
+from focus_app.main import app
 
 if __name__=='__main__':
     app.run()#debug=True
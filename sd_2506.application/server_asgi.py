@@ -0,0 +1,8 @@
+# 非同期サーバー（uvicorn）で起動する
+# 顔解析中もログイン・新規登録・先生用ページの表示が止まらない
+import uvicorn
+
+from focus_app.asgi import asgi_app
+
+if __name__ == '__main__':
+    uvicorn.run(asgi_app, host='127.0.0.1', port=5000)